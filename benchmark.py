@@ -0,0 +1,245 @@
+"""
+YCSB-style benchmark for the L-Store engine.
+
+Loads a table, then runs a configurable mix of reads, updates, scans and inserts through
+TransactionWorker threads, and reports throughput and per-operation latency percentiles.
+
+Example:
+    python benchmark.py --records 10000 --operations 50000 --threads 4 \
+        --mix read=0.5,update=0.5 --distribution zipfian --output results.json
+"""
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+from lstore.profiler import Profiler
+from lstore.scheduler import TransactionScheduler
+
+from argparse import ArgumentParser
+from bisect import bisect_left
+from functools import wraps
+from itertools import accumulate, count
+from random import Random
+from time import perf_counter, time
+import json
+import platform
+import sys
+
+OPERATIONS = ("read", "update", "scan", "insert")
+FIRST_KEY = 906659671
+NUM_COLUMNS = 5
+
+
+class UniformKeys:
+
+    def __init__(self, num_keys, rng):
+        self.num_keys = num_keys
+        self.rng = rng
+
+    def next(self):
+        return self.rng.randrange(self.num_keys)
+
+
+class ZipfianKeys:
+
+    """
+    # Draws key ranks with probability proportional to 1 / rank^theta, hottest keys first
+    """
+    def __init__(self, num_keys, rng, theta):
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / rank ** theta for rank in range(1, num_keys + 1)))
+
+    def next(self):
+        return bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+"""
+# Parses "read=0.5,update=0.5" into normalized cumulative weights
+"""
+def parse_mix(text):
+    weights = dict.fromkeys(OPERATIONS, 0.0)
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in weights:
+            raise ValueError("unknown operation %r, expected one of %s" % (name, ", ".join(OPERATIONS)))
+        weights[name] = float(weight)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("the operation mix is empty")
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+"""
+# Wraps a query so that run.latency holds the latency in seconds of its last call and run.calls counts its
+# calls. A retried transaction calls its queries again, so only the attempt that committed is kept.
+"""
+def timed(query):
+    @wraps(query)
+    def run(*args):
+        start = perf_counter()
+        result = query(*args)
+        run.latency = perf_counter() - start
+        run.calls += 1
+        return result
+    run.latency = None
+    run.calls = 0
+    return run
+
+
+def run_benchmark(config):
+    rng = Random(config.seed)
+    mix = parse_mix(config.mix)
+    names = [name for name in OPERATIONS if mix[name] > 0]
+    thresholds = list(accumulate(mix[name] for name in names))
+
+    db = Database()
+    table = db.create_table("Benchmark", NUM_COLUMNS, 0)
+    query = Query(table)
+    load_start = perf_counter()
+    for i in range(config.records):
+        query.insert(FIRST_KEY + i, *(rng.randrange(100) for _ in range(NUM_COLUMNS - 1)))
+    load_time = perf_counter() - load_start
+
+    if config.distribution == "zipfian":
+        keys = ZipfianKeys(config.records, rng, config.zipf_theta)
+    else:
+        keys = UniformKeys(config.records, rng)
+    new_keys = count(FIRST_KEY + config.records)
+
+    # (transaction, operation name, timed query) of every operation
+    timings = []
+    transactions = []
+    profiler = Profiler(config.sample_interval, config.profile) if config.profile else None
+    workers = [TransactionWorker(profiler=profiler, optimistic=config.optimistic) for _ in range(config.threads)]
+    queries = {
+        "read": query.select,
+        "update": query.update,
+        "scan": query.sum,
+        "insert": query.insert,
+    }
+    scheduler = TransactionScheduler(workers) if config.schedule else None
+    for number in range(0, config.operations, config.transaction_size):
+        worker = (number // config.transaction_size) % config.threads
+        transaction = Transaction()
+        for _ in range(min(config.transaction_size, config.operations - number)):
+            name = names[bisect_left(thresholds, rng.random() * thresholds[-1])]
+            operation = timed(queries[name])
+            timings.append((transaction, name, operation))
+            key = FIRST_KEY + keys.next()
+            if name == "read":
+                transaction.add_query(operation, table, key, 0, [1] * NUM_COLUMNS)
+            elif name == "update":
+                columns = [None] * NUM_COLUMNS
+                columns[rng.randrange(1, NUM_COLUMNS)] = rng.randrange(100)
+                transaction.add_query(operation, table, key, *columns)
+            elif name == "scan":
+                transaction.add_query(operation, table, key, key + config.scan_length - 1, rng.randrange(NUM_COLUMNS))
+            else:
+                transaction.add_query(operation, table, next(new_keys), *(rng.randrange(100) for _ in range(NUM_COLUMNS - 1)))
+        transactions.append(transaction)
+        (scheduler or workers[worker]).add_transaction(transaction)
+    if scheduler is not None:
+        scheduler.schedule()
+
+    if profiler is not None:
+        profiler.start()
+    run_start = perf_counter()
+    for worker in workers:
+        worker.run()
+    for worker in workers:
+        worker.join()
+    run_time = perf_counter() - run_start
+    if profiler is not None:
+        profiler.stop()
+
+    # One sample per operation of a committed transaction, the attempt that committed
+    samples = {name: [] for name in names}
+    retries = dict.fromkeys(names, 0)
+    for transaction, name, operation in timings:
+        if transaction.abort_reason is None and operation.latency is not None:
+            samples[name].append(operation.latency)
+            retries[name] += operation.calls - 1
+    if config.optimistic:
+        # Optimistic writes only stage their changes when called, they are applied in the write phase at commit
+        samples["commit"] = [transaction.write_phase_time for transaction in transactions if transaction.abort_reason is None]
+        retries["commit"] = 0
+    operations = {}
+    for name in samples:
+        latencies = sorted(samples[name])
+        operations[name] = {
+            "count": len(latencies),
+            "retried_calls": retries[name],
+            "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else None,
+            "p50_ms": 1000 * percentile(latencies, 0.50) if latencies else None,
+            "p95_ms": 1000 * percentile(latencies, 0.95) if latencies else None,
+            "p99_ms": 1000 * percentile(latencies, 0.99) if latencies else None,
+            "max_ms": 1000 * latencies[-1] if latencies else None,
+        }
+    committed = sum(worker.result for worker in workers)
+    return {
+        "config": vars(config),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "started": time(),
+        "load_seconds": load_time,
+        "run_seconds": run_time,
+        "transactions_committed": committed,
+        "transactions_aborted": sum(worker.aborts for worker in workers),
+        "transactions_failed": sum(worker.failures for worker in workers),
+        "throughput_ops_per_second": config.operations / run_time if run_time else None,
+        "operations": operations,
+        "profile": profiler.summary() if profiler is not None else None,
+    }
+
+
+def report(results):
+    print("Loaded %d records in %.3fs" % (results["config"]["records"], results["load_seconds"]))
+    print("Ran %d operations on %d threads in %.3fs: %.0f ops/s, %d commits, %d retried aborts, %d failed" % (
+        results["config"]["operations"], results["config"]["threads"], results["run_seconds"],
+        results["throughput_ops_per_second"], results["transactions_committed"], results["transactions_aborted"],
+        results["transactions_failed"]))
+    print("%-8s %10s %10s %10s %10s %10s %10s" % ("op", "count", "retries", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for name, stats in results["operations"].items():
+        if stats["count"]:
+            print("%-8s %10d %10d %10.4f %10.4f %10.4f %10.4f" % (name, stats["count"], stats["retried_calls"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["max_ms"]))
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Run a YCSB-style workload against lstore")
+    parser.add_argument("--records", type=int, default=10000, help="records loaded before the run")
+    parser.add_argument("--operations", type=int, default=10000, help="operations executed during the run")
+    parser.add_argument("--threads", type=int, default=1, help="number of TransactionWorker threads")
+    parser.add_argument("--transaction-size", type=int, default=10, help="operations per transaction")
+    parser.add_argument("--mix", default="read=0.5,update=0.5", help="operation weights, e.g. read=0.9,update=0.05,scan=0.05")
+    parser.add_argument("--distribution", choices=("uniform", "zipfian"), default="uniform")
+    parser.add_argument("--zipf-theta", type=float, default=0.99, help="skew of the zipfian distribution")
+    parser.add_argument("--scan-length", type=int, default=100, help="keys aggregated by a scan")
+    parser.add_argument("--optimistic", action="store_true", help="use optimistic concurrency control instead of two-phase locking")
+    parser.add_argument("--schedule", action="store_true", help="group transactions with common keys on one worker")
+    parser.add_argument("--seed", type=int, default=3562901)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--profile", help="profile transactions and write sampled stacks to this file")
+    parser.add_argument("--sample-interval", type=float, default=0.005, help="seconds between stack samples when profiling")
+    config = parser.parse_args(argv)
+
+    results = run_benchmark(config)
+    report(results)
+    if results["profile"] is not None:
+        print("Profile (stack samples in %s):" % config.profile)
+        for name, worker in results["profile"]["workers"].items():
+            throughput = worker["commits"] / worker["wall_seconds"] if worker["wall_seconds"] else 0
+            print("  %-12s commits %6d (%7.0f/s) aborts %6d wall %.3fs off-cpu %.3fs lock %.3fs aborted %.3fs" % (
+                name, worker["commits"], throughput, worker["aborts"], worker["wall_seconds"], worker["off_cpu_seconds"],
+                worker["lock_wait_seconds"], worker["aborted_seconds"]))
+    if config.output:
+        with open(config.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.bufferpool import buffer_pool
+
+from random import randint, seed
+import shutil
+
+# Reads a persisted table through a buffer pool far smaller than the table, so pages are evicted and
+# fetched again all the time
+shutil.rmtree('./BufferPoolTest', ignore_errors=True)
+db = Database()
+db.open('./BufferPoolTest')
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+records = {}
+number_of_records = 20000
+seed(3562901)
+
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+for key in range(92106429, 92106429 + number_of_records, 3):
+    records[key][2] = randint(0, 20)
+    query.update(key, None, None, records[key][2], None, None)
+db.close()
+print("Insert finished")
+
+capacity = buffer_pool.capacity
+db = Database()
+db.open('./BufferPoolTest')
+buffer_pool.resize(0)
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+db.enable_stats()
+
+errors = 0
+keys = list(records.keys())
+for _ in range(3):
+    for i in range(0, number_of_records, 7):
+        key = keys[randint(0, number_of_records - 1)]
+        result = query.select(key, 0, [1, 1, 1, 1, 1])[0].columns
+        if result != records[key]:
+            print('select error on', key, ':', result, ', correct:', records[key])
+            errors += 1
+    for c in range(0, grades_table.num_columns):
+        result = query.sum(keys[0], keys[-1], c)
+        correct = sum(record[c] for record in records.values())
+        if result != correct:
+            print('sum error on column', c, ':', result, ', correct:', correct)
+            errors += 1
+
+# Fill the pool with pages that were all used since they were loaded, then fetch a page evicted earlier:
+# the clock hand sweeps the whole pool before it reaches the page being fetched, which must stay resident
+read_ahead = buffer_pool.read_ahead
+buffer_pool.read_ahead = 0
+pages = [page for page_range in grades_table.page_ranges for page_set in page_range.base_pages for page in page_set]
+pool = buffer_pool.capacity
+for page in pages:
+    page.read(0)
+for _ in range(2):
+    for page in pages[-pool:]:
+        page.read(0)
+for position, page in enumerate(pages[:pool]):
+    try:
+        page.read(0)
+    except AttributeError:
+        print('page', position, 'was evicted while it was fetched')
+        errors += 1
+buffer_pool.read_ahead = read_ahead
+
+stats = db.stats(reset=True)
+db.enable_stats(False)
+if not stats['counters'].get('buffer_pool.evictions'):
+    print('no page was evicted')
+    errors += 1
+print('Errors', errors)
+
+buffer_pool.resize(capacity)
+db.close()
+shutil.rmtree('./BufferPoolTest', ignore_errors=True)
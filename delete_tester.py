@@ -0,0 +1,129 @@
+from lstore.db import Database
+from lstore.query import Query
+
+from random import randint, sample, seed
+
+db = Database()
+db.open('./CS451')
+# Students are deleted, the table is merged so their slots and RIDs are reclaimed, then some come back
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+# dictionary for records to test the database: test directory
+records = {}
+# the versions of every record, oldest first, to check select_version
+versions = {}
+errors = 0
+
+number_of_records = 1000
+number_of_updates = 3
+
+seed(451)
+
+
+def check(key, expected, relative_version=0):
+    global errors
+    result = query.select_version(key, 0, [1, 1, 1, 1, 1], relative_version)
+    if expected is None:
+        if result:
+            errors += 1
+            print('select error on deleted', key, 'version', relative_version, ':', result[0].columns)
+        return
+    if len(result) != 1 or result[0].columns != expected:
+        errors += 1
+        print('select error on', key, 'version', relative_version, ':', [record.columns for record in result], ', correct:', expected)
+
+
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    versions[key] = [records[key].copy()]
+    query.insert(*records[key])
+keys = sorted(records.keys())
+print("Insert finished")
+
+for _ in range(number_of_updates):
+    for key in keys:
+        updated_columns = [None, randint(0, 20), None, randint(0, 20), None]
+        for column, value in enumerate(updated_columns):
+            if value is not None:
+                records[key][column] = value
+        versions[key].append(records[key].copy())
+        query.update(key, *updated_columns)
+print("Update finished")
+
+rids = {key: query.select(key, 0, [1, 1, 1, 1, 1])[0].rid for key in keys}
+deleted = sorted(sample(keys, number_of_records // 2))
+for key in deleted:
+    query.delete(key)
+    del records[key]
+    del versions[key]
+for key in deleted:
+    check(key, None)
+    check(key, None, -1)
+for key in records:
+    check(key, records[key])
+    check(key, versions[key][-2], -1)
+print("Delete finished")
+
+grades_table.merge()
+freed = set(grades_table.free_rids)
+if freed != {rids[key] for key in deleted}:
+    errors += 1
+    print('merge error: freed', len(freed), 'RIDs, deleted', len(deleted))
+for key in deleted:
+    check(key, None)
+for key in records:
+    check(key, records[key])
+    for relative_version in range(-number_of_updates, 1):
+        check(key, versions[key][relative_version - 1], relative_version)
+print("Merge finished")
+
+# The deleted keys come back with new values, in the RIDs freed by the merge
+reinserted = deleted[:len(deleted) // 2]
+for key in reinserted:
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    versions[key] = [records[key].copy()]
+    query.insert(*records[key])
+for key in reinserted:
+    rid = query.select(key, 0, [1, 1, 1, 1, 1])[0].rid
+    if rid not in freed:
+        errors += 1
+        print('reuse error on', key, ': RID', rid, 'was not freed')
+    # A new record has no history, none of the deleted record's versions may show through
+    check(key, records[key])
+    check(key, records[key], -1)
+    updated_columns = [None, None, randint(0, 20), None, None]
+    records[key][2] = updated_columns[2]
+    versions[key].append(records[key].copy())
+    query.update(key, *updated_columns)
+    check(key, records[key])
+    check(key, versions[key][0], -1)
+for key in deleted[len(deleted) // 2:]:
+    check(key, None)
+print("Reinsert finished")
+
+for _ in range(100):
+    left, right = sorted(sample(keys, 2))
+    column = randint(0, 4)
+    expected = sum(records[key][column] for key in keys if left <= key <= right and key in records)
+    result = query.sum(left, right, column)
+    if result != expected:
+        errors += 1
+        print('sum error on [', left, ',', right, ']:', result, ', correct:', expected)
+print("Aggregate finished")
+
+db.close()
+
+db = Database()
+db.open('./CS451')
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+for key in keys:
+    check(key, records.get(key))
+for key in reinserted:
+    check(key, versions[key][0], -1)
+print("Reopen finished")
+db.close()
+
+print("Errors", errors)
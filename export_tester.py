@@ -0,0 +1,129 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.columnar import CorruptExport
+
+from random import randint, sample, seed
+import os
+
+db = Database()
+db.open('./CS451')
+# The grades are exported with their history and imported back as a second table, then the export is damaged
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+# dictionary for records to test the database: test directory
+records = {}
+# the versions of every record, oldest first, to check select_version
+versions = {}
+errors = 0
+
+# More than one page range, so the export has several chunks
+number_of_records = 10000
+number_of_updates = 3
+number_of_deletes = 500
+
+seed(48)
+
+
+def check(query, key, expected, relative_version=0):
+    global errors
+    result = query.select_version(key, 0, [1, 1, 1, 1, 1], relative_version)
+    if expected is None:
+        if result:
+            errors += 1
+            print('select error on deleted', key, ':', result[0].columns)
+        return
+    if len(result) != 1 or result[0].columns != expected:
+        errors += 1
+        print('select error on', key, 'version', relative_version, ':', [record.columns for record in result], ', correct:', expected)
+
+
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    versions[key] = [records[key].copy()]
+    query.insert(*records[key])
+keys = sorted(records.keys())
+print("Insert finished")
+
+for _ in range(number_of_updates):
+    for key in sample(keys, number_of_records // 2):
+        updated_columns = [None, randint(0, 20), randint(0, 20), None, randint(0, 20)]
+        for column, value in enumerate(updated_columns):
+            if value is not None:
+                records[key][column] = value
+        versions[key].append(records[key].copy())
+        query.update(key, *updated_columns)
+deleted = sample(keys, number_of_deletes)
+for key in deleted:
+    query.delete(key)
+    del records[key]
+    del versions[key]
+print("Update finished")
+
+history_path = os.path.join('CS451', 'grades_history.lsx')
+current_path = os.path.join('CS451', 'grades.lsx')
+grades_table.export(history_path, history=True)
+grades_table.export(current_path)
+copy = Query(db.import_table(history_path, 'History'))
+latest = Query(db.import_table(current_path, 'Latest'))
+for key in keys:
+    check(copy, key, records.get(key))
+    check(latest, key, records.get(key))
+    if key in records:
+        for relative_version in range(-len(versions[key]) + 1, 1):
+            check(copy, key, versions[key][relative_version - 1], relative_version)
+        # Without the history a record has a single version
+        check(latest, key, records[key], -1)
+for _ in range(100):
+    left, right = sorted(sample(keys, 2))
+    column = randint(0, 4)
+    expected = sum(records[key][column] for key in keys if left <= key <= right and key in records)
+    for result in (copy.sum(left, right, column), latest.sum(left, right, column)):
+        if result != expected:
+            errors += 1
+            print('sum error on [', left, ',', right, ']:', result, ', correct:', expected)
+print("Import finished")
+
+try:
+    db.import_table(current_path, 'Latest')
+    errors += 1
+    print('import error: replaced an existing table without overwrite')
+except ValueError:
+    pass
+
+with open(history_path, 'rb') as file:
+    data = bytearray(file.read())
+damaged_path = os.path.join('CS451', 'damaged.lsx')
+# A byte in the middle of the file lands in the payload of a chunk past the first one
+data[len(data) // 2] ^= 0xFF
+with open(damaged_path, 'wb') as file:
+    file.write(data)
+truncated_path = os.path.join('CS451', 'truncated.lsx')
+with open(truncated_path, 'wb') as file:
+    file.write(data[:len(data) * 3 // 4])
+for path in (damaged_path, truncated_path):
+    try:
+        db.import_table(path, 'Damaged')
+        errors += 1
+        print('import error: no CorruptExport on', path)
+    except CorruptExport:
+        pass
+    if db.get_table('Damaged') is not None:
+        errors += 1
+        print('import error: a failed import left its table behind')
+print("Corrupt finished")
+
+db.close()
+
+db = Database()
+db.open('./CS451')
+copy = Query(db.get_table('History'))
+for key in keys:
+    check(copy, key, records.get(key))
+    if key in records:
+        check(copy, key, versions[key][0], -len(versions[key]) + 1)
+print("Reopen finished")
+db.close()
+
+print("Errors", errors)
@@ -0,0 +1,279 @@
+from lstore.metrics import metrics
+from lstore.config import BUFFER_POOL_PAGES, READ_AHEAD_PAGES
+from collections import OrderedDict
+from queue import SimpleQueue
+from threading import Lock, Thread
+import os
+import pickle
+
+
+class PageUsage:
+
+    """
+    # Bytes of the pages of a table held in memory, kept up to date as pages are created, written to,
+    # loaded and evicted so the memory manager never has to walk them
+    #   pages           pages only held in memory, counted by the table, and pages written to since the
+    #                   last save, counted by the buffer pool when it pins them
+    #   buffered_pages  clean resident pages, counted by the buffer pool
+    # pages only changes under the latch of the table, buffered_pages under the lock of the buffer pool.
+    """
+    __slots__ = ('pages', 'buffered_pages')
+
+    def __init__(self):
+        self.pages = 0
+        self.buffered_pages = 0
+
+
+class PageFile:
+
+    """
+    # An open pages file of a persisted table. Pages are stored column by column, so the pages of one
+    # column sit next to each other in the file and a scan of that column reads it sequentially.
+    :param path: string     #Path of the pages file
+    :param usage: PageUsage #Memory use of the table the file belongs to, shared by all its files
+    """
+    def __init__(self, path, usage):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.usage = usage
+        # Every page stored in the file, in file order
+        self.pages = []
+        # Column -> position of the last page of that column read on demand
+        self.last_read = {}
+
+    def read(self, offset, length):
+        return os.pread(self.fd, length, offset)
+
+    # Closed once no page refers to it any more, a background read may still be using it until then
+    def __del__(self):
+        os.close(self.fd)
+
+
+class DiskPage:
+
+    """
+    # A page of a persisted table. It is read from its file on first use and can be evicted by the buffer
+    # pool again while it is clean. Once written to it stays resident until the table is saved.
+    # Exposes the read and write interface of Page and of the compressed pages.
+    :param location: tuple  #(PageFile, offset, length) of the pickled page
+    :param column: int      #Physical column the page belongs to
+    :param page: Page       #The page itself if it is already in memory
+    """
+    __slots__ = ('location', 'position', 'column', 'page', 'dirty', 'referenced', 'read_ahead')
+
+    def __init__(self, location, column, page=None):
+        self.location = location
+        self.position = None
+        self.column = column
+        self.page = page
+        self.dirty = False
+        # Second chance bit of the clock eviction, set by every access
+        self.referenced = True
+        # Set on the first page of a read-ahead window, using it schedules the next window
+        self.read_ahead = False
+
+    def resident(self):
+        page = self.page
+        if page is None:
+            return buffer_pool.fetch(self)
+        self.referenced = True
+        if self.read_ahead:
+            self.read_ahead = False
+            buffer_pool.prefetch(self)
+        if metrics.enabled:
+            metrics.count("buffer_pool.hits")
+        return page
+
+    def modified(self):
+        if not self.dirty:
+            buffer_pool.pin(self)
+        return self.page
+
+    def blob(self):
+        file, offset, length = self.location
+        return file.read(offset, length)
+
+    @property
+    def num_records(self):
+        return self.resident().num_records
+
+    def has_capacity(self):
+        return self.resident().has_capacity()
+
+    def write(self, value):
+        return self.modified().write(value)
+
+    def write_many(self, values):
+        return self.modified().write_many(values)
+
+    def read(self, slot):
+        return self.resident().read(slot)
+
+    def update(self, slot, value):
+        self.modified().update(slot, value)
+
+    def values(self):
+        return self.resident().values()
+
+    def size(self):
+        return self.resident().size()
+
+    def sum(self):
+        return self.resident().sum()
+
+    def min(self):
+        return self.resident().min()
+
+    def max(self):
+        return self.resident().max()
+
+    # Unpickles as the page itself, so snapshots of a table never refer to its files
+    def __reduce__(self):
+        return pickle.loads, (pickle.dumps(self.resident(), pickle.HIGHEST_PROTOCOL),)
+
+
+# Fewest pages the pool is resized to, enough for a scan and its read-ahead window to stay resident
+MIN_BUFFER_POOL_PAGES = 4 * READ_AHEAD_PAGES + 16
+
+
+class BufferPool:
+
+    """
+    # Bounds the number of clean pages of persisted tables kept in memory, evicting with the clock
+    # algorithm, and reads ahead on a background thread when a column is read sequentially
+    :param capacity: int    #Maximum number of clean resident pages
+    :param read_ahead: int  #Pages read ahead of a sequential scan, 0 disables read-ahead
+    """
+    def __init__(self, capacity=BUFFER_POOL_PAGES, read_ahead=READ_AHEAD_PAGES):
+        self.capacity = capacity
+        # Capacity the pool was created with, resize never grows it beyond that
+        self.limit = capacity
+        self.read_ahead = read_ahead
+        self.lock = Lock()
+        # Clean resident pages in the order they were loaded, the clock hand is at the front
+        self.resident = OrderedDict()
+        self.requests = SimpleQueue()
+        self.reader = None
+
+    """
+    # Reads a page that is not resident, and starts reading ahead if its column is being scanned
+    """
+    def fetch(self, disk_page):
+        if metrics.enabled:
+            metrics.count("buffer_pool.misses")
+        page = pickle.loads(disk_page.blob())
+        file = disk_page.location[0]
+        position = disk_page.position
+        sequential = file.last_read.get(disk_page.column) == position - 1
+        file.last_read[disk_page.column] = position
+        with self.lock:
+            if disk_page.page is None:
+                disk_page.page = page
+                disk_page.referenced = True
+                self.__admit(disk_page)
+            else:
+                page = disk_page.page
+        if sequential and self.read_ahead:
+            self.prefetch(disk_page)
+        return page
+
+    """
+    # Queues the read of the pages that follow disk_page in the same column. The first of them is marked,
+    # so the next window is queued as soon as the scan reaches this one.
+    """
+    def prefetch(self, disk_page):
+        file = disk_page.location[0]
+        window = []
+        for position in range(disk_page.position + 1, min(disk_page.position + 1 + self.read_ahead, len(file.pages))):
+            following = file.pages[position]
+            if following.column != disk_page.column:
+                break
+            window.append(following)
+        if not window:
+            return
+        window[0].read_ahead = True
+        if self.reader is None:
+            with self.lock:
+                if self.reader is None:
+                    self.reader = Thread(target=self.__read_ahead, name="lstore-read-ahead", daemon=True)
+                    self.reader.start()
+        for following in window:
+            if following.page is None:
+                self.requests.put(following)
+
+    """
+    # Makes a page resident for good, until the table is saved, as it is about to be written to
+    """
+    def pin(self, disk_page):
+        with self.lock:
+            if disk_page.page is None:
+                if metrics.enabled:
+                    metrics.count("buffer_pool.misses")
+                disk_page.page = pickle.loads(disk_page.blob())
+            elif disk_page in self.resident:
+                del self.resident[disk_page]
+                disk_page.location[0].usage.buffered_pages -= disk_page.page.size()
+            disk_page.referenced = True
+            disk_page.dirty = True
+            disk_page.location[0].usage.pages += disk_page.page.size()
+
+    """
+    # Hands a resident page that was just written out back to the eviction policy
+    """
+    def unpin(self, disk_page):
+        with self.lock:
+            disk_page.dirty = False
+            self.__admit(disk_page)
+
+    """
+    # Changes the number of clean pages kept, at most the capacity the pool was created with, evicting
+    # pages beyond it
+    """
+    def resize(self, capacity):
+        with self.lock:
+            self.capacity = max(MIN_BUFFER_POOL_PAGES, min(capacity, self.limit))
+            self.__evict()
+
+    def __admit(self, disk_page):
+        if disk_page not in self.resident:
+            disk_page.location[0].usage.buffered_pages += disk_page.page.size()
+        self.resident[disk_page] = None
+        self.__evict(disk_page)
+
+    """
+    # Evicts pages until the pool is within capacity, never the page being admitted, which its caller
+    # is about to use
+    """
+    def __evict(self, admitted=None):
+        while len(self.resident) > self.capacity:
+            victim, _ = self.resident.popitem(last=False)
+            if victim is admitted:
+                self.resident[victim] = None
+                if len(self.resident) == 1:
+                    break
+                continue
+            if victim.referenced:
+                victim.referenced = False
+                self.resident[victim] = None
+                continue
+            victim.location[0].usage.buffered_pages -= victim.page.size()
+            victim.page = None
+            if metrics.enabled:
+                metrics.count("buffer_pool.evictions")
+
+    def __read_ahead(self):
+        while True:
+            disk_page = self.requests.get()
+            if disk_page.page is not None:
+                continue
+            page = pickle.loads(disk_page.blob())
+            with self.lock:
+                if disk_page.page is None:
+                    disk_page.page = page
+                    # Not used yet, so the first sweep of the clock may take it back
+                    disk_page.referenced = False
+                    self.__admit(disk_page)
+                    if metrics.enabled:
+                        metrics.count("buffer_pool.prefetches")
+
+
+buffer_pool = BufferPool()
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+
+
+class RecordCache:
+
+    """
+    # Bounded LRU cache of the fully resolved latest version of base records
+    :param capacity: int    #Maximum number of records kept
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # Capacity the cache was created with, resize never grows it beyond that
+        self.limit = capacity
+        self.records = OrderedDict()
+
+    """
+    # Returns the cached columns of the record with the given RID, or None on a miss
+    """
+    def get(self, rid):
+        columns = self.records.get(rid)
+        if columns is not None:
+            self.records.move_to_end(rid)
+        return columns
+
+    def put(self, rid, columns):
+        self.records[rid] = columns
+        self.records.move_to_end(rid)
+        if len(self.records) > self.capacity:
+            self.records.popitem(last=False)
+
+    """
+    # Changes the number of records kept, at most the capacity the cache was created with, evicting the
+    # least recently used records beyond it
+    """
+    def resize(self, capacity):
+        self.capacity = max(1, min(capacity, self.limit))
+        while len(self.records) > self.capacity:
+            self.records.popitem(last=False)
+
+    def invalidate(self, rid):
+        self.records.pop(rid, None)
+
+    def clear(self):
+        self.records.clear()
@@ -0,0 +1,89 @@
+"""
+The columnar file format of Table.export and Database.import_table.
+
+A file starts with MAGIC and a length-prefixed JSON header describing the table, followed by chunks.
+Every chunk is a fixed header (kind, number of rows, payload length, CRC-32 of the payload) and a
+zlib-compressed payload of little-endian 64-bit columns, one after the other:
+    ROWS        the user columns of up to one page range of records, in export order
+    VERSIONS    the ordinal of a record among the exported rows, then the user columns of a later
+                version of it, oldest first, present when the history is exported
+    END         no payload, its row count is the number of records exported, so truncation is detected
+"""
+from array import array
+from zlib import compress, decompress, crc32
+import json
+import struct
+import sys
+
+MAGIC = b'LSTORE\x00\x01'
+LENGTH = struct.Struct('<I')
+CHUNK_HEADER = struct.Struct('<BIII')
+
+ROWS = 1
+VERSIONS = 2
+END = 3
+
+
+class CorruptExport(ValueError):
+    pass
+
+
+def write_header(file, header):
+    encoded = json.dumps(header).encode()
+    file.write(MAGIC)
+    file.write(LENGTH.pack(len(encoded)))
+    file.write(encoded)
+
+
+def read_header(file):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise CorruptExport("not an lstore export")
+    length, = LENGTH.unpack(file.read(LENGTH.size))
+    return json.loads(file.read(length))
+
+
+"""
+# Writes a chunk of equally long columns
+"""
+def write_chunk(file, kind, columns):
+    rows = len(columns[0])
+    data = bytearray()
+    for column in columns:
+        packed = column if isinstance(column, array) else array('q', column)
+        if sys.byteorder == 'big':
+            packed = array('q', packed)
+            packed.byteswap()
+        data += packed.tobytes()
+    payload = compress(data, 1)
+    file.write(CHUNK_HEADER.pack(kind, rows, len(payload), crc32(payload)))
+    file.write(payload)
+
+
+def write_end(file, rows):
+    file.write(CHUNK_HEADER.pack(END, rows, 0, 0))
+
+
+"""
+# Yields (kind, rows, columns) for every chunk up to the END chunk, columns as array('q') of length rows
+:param width: int       #Number of columns in ROWS chunks, VERSIONS chunks have one more
+"""
+def read_chunks(file, width):
+    while True:
+        header = file.read(CHUNK_HEADER.size)
+        if len(header) < CHUNK_HEADER.size:
+            raise CorruptExport("export is truncated")
+        kind, rows, length, checksum = CHUNK_HEADER.unpack(header)
+        if kind == END:
+            yield kind, rows, []
+            return
+        payload = file.read(length)
+        if len(payload) < length or crc32(payload) != checksum:
+            raise CorruptExport("chunk checksum mismatch")
+        values = array('q')
+        values.frombytes(decompress(payload))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        count = width + (kind == VERSIONS)
+        if len(values) != rows * count:
+            raise CorruptExport("chunk has the wrong size")
+        yield kind, rows, [values[column * rows:(column + 1) * rows] for column in range(count)]
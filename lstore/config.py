@@ -0,0 +1,52 @@
+"""
+Global constants shared by the storage layer
+"""
+
+# Size of a physical page in bytes and of a single column cell within it
+PAGE_SIZE = 4096
+CELL_SIZE = 8
+PAGE_CAPACITY = PAGE_SIZE // CELL_SIZE
+
+# Number of base page sets grouped into a single page range
+BASE_PAGES_PER_RANGE = 16
+
+# Number of updates to a page range after which its tail records are merged into the base pages
+MERGE_THRESHOLD = PAGE_CAPACITY * 4
+
+# Whether full base pages are re-encoded (run-length, frame-of-reference or delta) when merged
+COMPRESS_MERGED_PAGES = True
+
+# Number of records kept in a table's latest-version read cache, 0 disables it
+RECORD_CACHE_SIZE = 0
+
+# Number of previous versions per record kept reachable by select_version when tail records are
+# garbage collected on merge, None keeps the full history
+VERSION_RETENTION = None
+
+# Tables with at least this many base records build new indexes in a process pool, one page range per task
+PARALLEL_INDEX_BUILD_RECORDS = PAGE_CAPACITY * BASE_PAGES_PER_RANGE * 8
+
+# Processes used for parallel index builds, None uses one per CPU
+INDEX_BUILD_PROCESSES = None
+
+# Number of clean pages of persisted tables the buffer pool keeps in memory
+BUFFER_POOL_PAGES = 16384
+
+# Pages of a column read ahead on a background thread once the column is read sequentially, 0 disables it
+READ_AHEAD_PAGES = 8
+
+# Rows each thread buffers before its inserts are written to the base pages in bulk, 0 disables buffering
+INSERT_BUFFER_SIZE = 0
+
+# RIDs reserved at a time by each inserting thread for its base records, and by each page range for its
+# tail records, so writers draw from blocks of their own instead of a single counter
+RID_BLOCK_SIZE = 1024
+
+# Memory in bytes a database keeps its pages, indexes and record caches under, None for no limit
+MEMORY_BUDGET = None
+
+# Seconds between two checks of a database's memory use against its budget
+MEMORY_CHECK_INTERVAL = 1.0
+
+# Part of the memory left after indexes and page directories that goes to record caches, the rest to pages
+RECORD_CACHE_SHARE = 0.1
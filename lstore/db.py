@@ -1,17 +1,127 @@
 from lstore.table import Table
+from lstore.metrics import metrics
+from lstore.memory import MemoryManager
+from lstore.config import MEMORY_BUDGET
+from lstore.columnar import read_header, read_chunks, CorruptExport, ROWS, VERSIONS, END
+from lstore.snapshots import snapshots
+from array import array
+from contextlib import ExitStack
+from urllib.parse import quote
+import json
+import os
+import shutil
+
+# The catalog lists every table of a database with what is needed to open it without loading it
+CATALOG_FILE = 'catalog.json'
 
 class Database():
 
     def __init__(self):
-        self.tables = []
+        self.tables = {}
+        self.path = None
+        self.memory_manager = None
+        if MEMORY_BUDGET is not None:
+            self.set_memory_budget(MEMORY_BUDGET)
         pass
 
-    # Not required for milestone1
+    """
+    # Opens the database stored in path, creating it if needed. Only the catalog and the small header of
+    # each table are read here, a table's pages and indexes are loaded when it is first used.
+    """
     def open(self, path):
-        pass
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.tables = {}
+        catalog_path = os.path.join(path, CATALOG_FILE)
+        if not os.path.exists(catalog_path):
+            return
+        with open(catalog_path) as catalog_file:
+            catalog = json.load(catalog_file)
+        for name, entry in catalog['tables'].items():
+            self.tables[name] = Table.open(name, entry['num_columns'], entry['key'],
+                                           os.path.join(path, entry['directory']), entry['indexes'])
+
+    """
+    # Saves every table that was loaded, with its indexes, and the catalog
+    """
+    def checkpoint(self):
+        if self.path is None:
+            return
+        for table in self.tables.values():
+            table.save()
+        self.__write_catalog()
 
     def close(self):
-        pass
+        self.set_memory_budget(None)
+        self.checkpoint()
+
+    """
+    # Keeps the memory used by the tables under budget bytes, see lstore.memory.MemoryManager, or stops
+    # managing it if budget is None
+    """
+    def set_memory_budget(self, budget):
+        if self.memory_manager is not None:
+            self.memory_manager.stop()
+            self.memory_manager = None
+        if budget is not None:
+            self.memory_manager = MemoryManager(self, budget)
+            self.memory_manager.enforce()
+            self.memory_manager.start()
+
+    """
+    # Returns the estimated memory use of every table by kind, their total and the budget if one is set
+    """
+    def memory_usage(self):
+        if self.memory_manager is not None:
+            return self.memory_manager.usage()
+        return MemoryManager(self, None).usage()
+
+    """
+    # Writes a copy of the database to path, which Database.open reads like any other database, while
+    # queries and transactions go on. The tables are captured together, holding the latch of every loaded
+    # table only as long as it takes to take references to its pages and copy its page directory; the pages
+    # are serialized and written out afterwards. So that the copy holds only whole transactions, new
+    # transactions wait and running ones are let finish, committing or aborting, before the capture; they go
+    # on as soon as it is taken.
+    # The copy is built next to path and renamed into place once complete.
+    """
+    def snapshot(self, path):
+        if os.path.exists(path):
+            raise FileExistsError(path)
+        tables = dict(self.tables)
+        with ExitStack() as latches:
+            latches.enter_context(snapshots.quiesce())
+            for table in tables.values():
+                if table.is_loaded():
+                    table.flush_inserts()
+            # In name order, so that two snapshots never wait on each other
+            for name in sorted(tables):
+                if tables[name].is_loaded():
+                    latches.enter_context(tables[name].latch)
+            captures = {name: table.capture() for name, table in tables.items()}
+        building = path + '.partial'
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        catalog = {'tables': {}}
+        for name, table in tables.items():
+            directory = quote(name, safe='')
+            table.write_capture(captures[name], os.path.join(building, directory))
+            catalog['tables'][name] = {
+                'num_columns': table.num_columns,
+                'key': table.key,
+                'directory': directory,
+                'indexes': captures[name]['indexes'],
+            }
+        self.__write_catalog(building, catalog)
+        os.replace(building, path)
+
+    def __write_catalog(self, path=None, catalog=None):
+        if catalog is None:
+            catalog = {'tables': {name: table.catalog_entry() for name, table in self.tables.items()}}
+        catalog_path = os.path.join(self.path if path is None else path, CATALOG_FILE)
+        with open(catalog_path + '.tmp', 'w') as catalog_file:
+            json.dump(catalog, catalog_file, indent=2)
+        os.replace(catalog_path + '.tmp', catalog_path)
 
     """
     # Creates a new table
@@ -20,7 +130,15 @@ class Database():
     :param key: int             #Index of table key in columns
     """
     def create_table(self, name, num_columns, key_index):
-        table = Table(name, num_columns, key_index)
+        if name in self.tables:
+            self.drop_table(name)
+        path = os.path.join(self.path, quote(name, safe='')) if self.path is not None else None
+        table = Table(name, num_columns, key_index, path)
+        self.tables[name] = table
+        if self.path is not None:
+            # Write the empty table right away so the catalog never lists a table without files
+            table.save()
+            self.__write_catalog()
         return table
 
     
@@ -28,11 +146,72 @@ class Database():
     # Deletes the specified table
     """
     def drop_table(self, name):
-        pass
+        table = self.tables.pop(name, None)
+        if table is None or self.path is None:
+            return
+        self.__write_catalog()
+        shutil.rmtree(table.path, ignore_errors=True)
 
     
     """
     # Returns table with the passed name
     """
     def get_table(self, name):
-        pass
+        return self.tables.get(name)
+
+    """
+    # Creates a table from a file written by Table.export, writing its records to the base pages in bulk
+    # and building its indexes once at the end
+    :param name: string         #Name of the new table, the exported name if None
+    :param overwrite: bool      #Replace a table of the same name instead of raising ValueError
+    # Raises lstore.columnar.CorruptExport if the file is damaged, leaving behind no table of the import.
+    # A table it replaces is dropped before the records are read, and stays dropped.
+    """
+    def import_table(self, path, name=None, overwrite=False):
+        with open(path, 'rb') as file:
+            header = read_header(file)
+            name = header['name'] if name is None else name
+            if name in self.tables and not overwrite:
+                raise ValueError("table %s already exists" % name)
+            table = self.create_table(name, header['num_columns'], header['key'])
+            try:
+                with table.latch:
+                    # Ordinal of every imported row -> its RID
+                    rids = array('q')
+                    for kind, rows, columns in read_chunks(file, table.num_columns):
+                        if kind == ROWS:
+                            rids.extend(table.insert_records(columns))
+                        elif kind == VERSIONS:
+                            for position, ordinal in enumerate(columns[0]):
+                                rid = rids[ordinal]
+                                current = table.read(rid, range(table.num_columns))
+                                values = [column[position] for column in columns[1:]]
+                                table.update_record(rid, [None if new == old else new for old, new in zip(current, values)])
+                        elif kind == END and rows != len(rids):
+                            raise CorruptExport("export is missing records")
+                    for column in header['indexes']:
+                        if table.index.indices[column] is None:
+                            table.index.indices[column] = {}
+                    table.index.rebuild()
+            except Exception:
+                # Unless the name was taken over by another table meanwhile
+                if self.tables.get(name) is table:
+                    self.drop_table(name)
+                raise
+        return table
+
+    """
+    # Turns the collection of counters and latency histograms on or off, it is off by default
+    """
+    def enable_stats(self, enabled=True):
+        metrics.enabled = enabled
+
+    """
+    # Returns the collected counters and per-operation latency summaries
+    :param reset: bool          #Clear the statistics after reading them
+    """
+    def stats(self, reset=False):
+        snapshot = metrics.snapshot()
+        if reset:
+            metrics.reset()
+        return snapshot
@@ -1,3 +1,37 @@
+from lstore.metrics import metrics
+from lstore.config import PARALLEL_INDEX_BUILD_RECORDS, INDEX_BUILD_PROCESSES
+from concurrent.futures import ProcessPoolExecutor
+from heapq import merge
+from zlib import crc32
+import os
+import pickle
+import struct
+
+# A persisted index file starts with the checkpoint it belongs to and a CRC-32 of the pickled indices
+INDEX_FILE_HEADER = struct.Struct('<QI')
+
+
+"""
+# Returns the sorted (value, RID) pairs of the live records in a page range snapshot taken by
+# Table.snapshot_column. Runs in the worker processes of a parallel index build.
+"""
+def snapshot_entries(snapshot):
+    tps, column_bit, base_pages, tail_pages = pickle.loads(snapshot)
+    tail_values = {}
+    for rids, values in tail_pages:
+        tail_values.update(zip(rids.values(), values.values()))
+    entries = []
+    for indirections, rids, schemas, values in base_pages:
+        for indirection, rid, schema, value in zip(indirections.values(), rids.values(), schemas.values(), values.values()):
+            # A negative indirection is the tombstone of a deleted record
+            if indirection < 0:
+                continue
+            if indirection > tps and schema & column_bit:
+                value = tail_values[indirection]
+            entries.append((value, rid))
+    entries.sort()
+    return entries
+
 """
 A data strucutre holding indices for various columns of a table. Key column should be indexd by default, other columns can be indexed through this object. Indices are usually B-Trees, but other data structures can be used as well.
 """
@@ -6,7 +40,16 @@ class Index:
 
     def __init__(self, table):
         # One index for each table. All our empty initially.
+        self.table = table
         self.indices = [None] *  table.num_columns
+        # Each index maps a column value to the set of RIDs holding it
+        self.indices[table.key] = {}
+        # Whether each column has an index, or one being built, that updates have to maintain
+        self.maintained = [index is not None for index in self.indices]
+        # Column -> (RID, old value, new value) changes made while its index is being built, None for no value
+        self.side_logs = {}
+        # Bumped whenever an index is created or dropped, so prepared query plans know to re-resolve them
+        self.version = 0
         pass
 
     """
@@ -14,25 +57,195 @@ class Index:
     """
 
     def locate(self, column, value):
-        pass
+        index = self.indices[column]
+        if metrics.enabled:
+            metrics.count("index.lookups" if index is not None else "index.scans")
+        if index is None:
+            return self.table.scan(column, value, value)
+        return list(index.get(value, ()))
 
     """
     # Returns the RIDs of all records with values in column "column" between "begin" and "end"
     """
 
     def locate_range(self, begin, end, column):
-        pass
+        index = self.indices[column]
+        if metrics.enabled:
+            metrics.count("index.range_lookups" if index is not None else "index.scans")
+        if index is None:
+            return self.table.scan(column, begin, end)
+        rids = []
+        # All columns are integers, so a narrow range is cheaper to probe value by value
+        if end - begin < len(index):
+            for value in range(begin, end + 1):
+                if value in index:
+                    rids.extend(index[value])
+        else:
+            for value, entries in index.items():
+                if begin <= value <= end:
+                    rids.extend(entries)
+        return rids
+
+    """
+    # Adds a newly inserted record to every index
+    """
+
+    def insert_entry(self, rid, columns):
+        for column, index in enumerate(self.indices):
+            if index is not None:
+                index.setdefault(columns[column], set()).add(rid)
+        if self.side_logs:
+            for column, log in self.side_logs.items():
+                log.append((rid, None, columns[column]))
+
+    """
+    # Moves a record from old_value to new_value in the index of column, if there is one
+    """
+
+    def update_entry(self, rid, column, old_value, new_value):
+        index = self.indices[column]
+        if index is None or old_value == new_value:
+            if column in self.side_logs and old_value != new_value:
+                self.side_logs[column].append((rid, old_value, new_value))
+            return
+        self._discard(index, old_value, rid)
+        index.setdefault(new_value, set()).add(rid)
+
+    """
+    # Removes a record from every index
+    """
+
+    def remove_entry(self, rid, columns):
+        for column, index in enumerate(self.indices):
+            if index is not None:
+                self._discard(index, columns[column], rid)
+        if self.side_logs:
+            for column, log in self.side_logs.items():
+                log.append((rid, columns[column], None))
+
+    def _discard(self, index, value, rid):
+        entries = index.get(value)
+        if entries is not None:
+            entries.discard(rid)
+            if not entries:
+                del index[value]
 
     """
     # optional: Create index on specific column
+    # Small tables are indexed under the latch. Large ones are snapshotted page range by page range under
+    # the latch, then the snapshots are resolved and sorted in a process pool while the table stays open;
+    # changes made meanwhile go to a side log that is replayed on the merged index before it is published.
     """
 
     def create_index(self, column_number):
-        pass
+        self.table.flush_inserts()
+        with self.table.latch:
+            if self.maintained[column_number]:
+                return
+            if len(self.table.page_directory) < PARALLEL_INDEX_BUILD_RECORDS or len(self.table.page_ranges) < 2:
+                index = {}
+                for rid in self.table.base_rids():
+                    value = self.table.read(rid, (column_number,))[0]
+                    index.setdefault(value, set()).add(rid)
+                self.indices[column_number] = index
+                self.maintained[column_number] = True
+                self.version += 1
+                return
+            snapshots = self.table.snapshot_column(column_number)
+            log = self.side_logs[column_number] = []
+            self.maintained[column_number] = True
+            # Prepared updates have to start reporting changes of this column
+            self.version += 1
+        try:
+            with ProcessPoolExecutor(min(INDEX_BUILD_PROCESSES or os.cpu_count() or 1, len(snapshots))) as pool:
+                partitions = list(pool.map(snapshot_entries, snapshots))
+            index = {}
+            for value, rid in merge(*partitions):
+                entries = index.get(value)
+                if entries is None:
+                    index[value] = {rid}
+                else:
+                    entries.add(rid)
+        except BaseException:
+            with self.table.latch:
+                del self.side_logs[column_number]
+                self.maintained[column_number] = False
+                self.version += 1
+            raise
+        with self.table.latch:
+            del self.side_logs[column_number]
+            for rid, old_value, new_value in log:
+                if old_value is not None:
+                    self._discard(index, old_value, rid)
+                if new_value is not None:
+                    index.setdefault(new_value, set()).add(rid)
+            self.indices[column_number] = index
+            self.version += 1
+            if metrics.enabled:
+                metrics.count("index.parallel_builds")
+                metrics.count("index.side_log_entries", len(log))
+
+    """
+    # Rebuilds every existing index from the latest values of the records
+    """
+
+    def rebuild(self):
+        with self.table.latch:
+            columns = [column for column, index in enumerate(self.indices) if index is not None]
+            for column in columns:
+                self.indices[column] = {}
+            for rid in self.table.base_rids():
+                for column, value in zip(columns, self.table.read(rid, columns)):
+                    self.indices[column].setdefault(value, set()).add(rid)
+            self.maintained = [index is not None for index in self.indices]
+            self.version += 1
+
+    """
+    # Writes every index to path, stamped with the checkpoint number of the table save it belongs to
+    """
+
+    def save(self, path, checkpoint):
+        payload = pickle.dumps(self.indices, pickle.HIGHEST_PROTOCOL)
+        with open(path, 'wb') as index_file:
+            index_file.write(INDEX_FILE_HEADER.pack(checkpoint, crc32(payload)))
+            index_file.write(payload)
+
+    """
+    # Replaces the indices with the ones persisted in path. Returns False, leaving the indices untouched,
+    # if the file is missing, corrupt, from another checkpoint or indexes other columns, so the caller rebuilds.
+    # The whole file is read and unpickled, so loading still takes time in proportion to the size of the
+    # indexes; it saves the rebuild, which reads every page of the indexed columns.
+    :param columns: list        #Columns expected to be indexed
+    """
+
+    def load(self, path, checkpoint, columns):
+        try:
+            with open(path, 'rb') as index_file:
+                stamp, checksum = INDEX_FILE_HEADER.unpack(index_file.read(INDEX_FILE_HEADER.size))
+                if stamp != checkpoint:
+                    return False
+                payload = index_file.read()
+            if crc32(payload) != checksum:
+                return False
+            indices = pickle.loads(payload)
+        except (OSError, ValueError, struct.error, pickle.UnpicklingError):
+            return False
+        if len(indices) != len(self.indices) or {column for column, index in enumerate(indices) if index is not None} != set(columns):
+            return False
+        self.indices = indices
+        self.maintained = [index is not None for index in indices]
+        self.version += 1
+        return True
 
     """
     # optional: Drop index of specific column
     """
 
     def drop_index(self, column_number):
-        pass
+        # The primary key index is required to enforce uniqueness
+        if column_number == self.table.key:
+            return
+        with self.table.latch:
+            self.indices[column_number] = None
+            self.maintained[column_number] = False
+            self.version += 1
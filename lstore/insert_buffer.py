@@ -0,0 +1,60 @@
+from array import array
+from threading import Lock
+
+
+class InsertBuffer:
+
+    """
+    # Rows inserted by one thread that have not been written to the base pages yet, kept column by column
+    # so they can be flushed a page at a time
+    :param num_columns: int     #Number of user columns
+    """
+    def __init__(self, num_columns):
+        self.lock = Lock()
+        self.columns = [array('q') for _ in range(num_columns)]
+        # Transaction that inserted each row, None outside transactions
+        self.owners = []
+
+    """
+    # Appends a row and returns the number of rows buffered
+    """
+    def append(self, columns, owner):
+        with self.lock:
+            for buffered, value in zip(self.columns, columns):
+                buffered.append(value)
+            self.owners.append(owner)
+            return len(self.owners)
+
+    """
+    # Removes the rows inserted outside transactions and those of owner, returning their columns and the
+    # owner of each row. Rows of other transactions are kept.
+    """
+    def take(self, owner=None):
+        with self.lock:
+            if all(row_owner is None or row_owner is owner for row_owner in self.owners):
+                columns, owners = self.columns, self.owners
+                self.columns = [array('q') for _ in columns]
+                self.owners = []
+                return columns, owners
+            taken = [position for position, row_owner in enumerate(self.owners) if row_owner is None or row_owner is owner]
+            kept = [position for position, row_owner in enumerate(self.owners) if row_owner is not None and row_owner is not owner]
+            columns = [array('q', [buffered[position] for position in taken]) for buffered in self.columns]
+            self.columns = [array('q', [buffered[position] for position in kept]) for buffered in self.columns]
+            owners = [self.owners[position] for position in taken]
+            self.owners = [self.owners[position] for position in kept]
+        return columns, owners
+
+    """
+    # Removes the row whose key column holds key
+    # Returns False if no such row is buffered
+    """
+    def discard(self, key_column, key):
+        with self.lock:
+            try:
+                position = self.columns[key_column].index(key)
+            except ValueError:
+                return False
+            for buffered in self.columns:
+                del buffered[position]
+            del self.owners[position]
+            return True
@@ -0,0 +1,54 @@
+from lstore.metrics import metrics
+from threading import Lock
+
+
+class LockManager:
+
+    """
+    # Record-level shared/exclusive locks for strict two-phase locking. Requests never wait: a conflicting
+    # request fails immediately, and the transaction is expected to abort and retry.
+    """
+    def __init__(self):
+        self.mutex = Lock()
+        # Resource -> [exclusive, set of holding transactions]
+        self.locks = {}
+
+    """
+    # Grants transaction a shared or exclusive lock on resource
+    # Returns False if another transaction holds a conflicting lock
+    """
+    def acquire(self, transaction, resource, exclusive):
+        with self.mutex:
+            lock = self.locks.get(resource)
+            if lock is None:
+                self.locks[resource] = [exclusive, {transaction}]
+                return True
+            holders = lock[1]
+            if transaction in holders:
+                if exclusive and not lock[0]:
+                    # Upgrade, only possible while the lock is not shared with anyone else
+                    if len(holders) > 1:
+                        if metrics.enabled:
+                            metrics.count("lock.conflicts")
+                        return False
+                    lock[0] = True
+                return True
+            if exclusive or lock[0]:
+                if metrics.enabled:
+                    metrics.count("lock.conflicts")
+                return False
+            holders.add(transaction)
+            return True
+
+    """
+    # Releases every lock held by transaction on the given resources
+    """
+    def release(self, transaction, resources):
+        with self.mutex:
+            for resource in resources:
+                lock = self.locks.get(resource)
+                if lock is None:
+                    continue
+                lock[1].discard(transaction)
+                if not lock[1]:
+                    del self.locks[resource]
@@ -0,0 +1,107 @@
+from lstore.bufferpool import buffer_pool
+from lstore.metrics import metrics
+from lstore.config import PAGE_SIZE, MEMORY_CHECK_INTERVAL, RECORD_CACHE_SHARE
+from threading import Event, Thread
+from time import monotonic
+
+# Longest time in seconds a table is left unsaved between two saves that did not bring memory under budget
+MAX_SPILL_BACKOFF = 60.0
+
+
+class MemoryManager:
+
+    """
+    # Keeps the estimated memory use of the tables of a database under a budget. Indexes and page
+    # directories cannot give memory back, so the budget left after them is split between the record
+    # caches and the pages: the pages only held in memory, and the buffer pool, which is resized to what
+    # remains. When the pages held in memory alone exceed their part, page ranges where a merge frees
+    # memory are merged, and if that is not enough persisted tables are saved, which hands their pages to
+    # the buffer pool so they can be evicted. The budget is checked every MEMORY_CHECK_INTERVAL seconds on a
+    # background thread, or whenever enforce is called.
+    # The buffer pool is shared by every database in the process, the last budget enforced sizes it.
+    :param database: Database   #Database whose tables are managed
+    :param budget: int          #Memory budget in bytes
+    """
+    def __init__(self, database, budget, interval=MEMORY_CHECK_INTERVAL):
+        self.database = database
+        self.budget = budget
+        self.interval = interval
+        self.stopped = Event()
+        self.checker = None
+        # Table name -> (earliest time it may be saved again, backoff for the save after that)
+        self.spills = {}
+
+    def start(self):
+        self.checker = Thread(target=self.__check, name="lstore-memory", daemon=True)
+        self.checker.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.checker is not None:
+            self.checker.join()
+            self.checker = None
+
+    """
+    # Returns the estimated memory use of every table, by kind as in Table.memory_usage, and the total
+    """
+    def usage(self):
+        tables = {name: table.memory_usage() for name, table in list(self.database.tables.items())}
+        return {
+            'budget': self.budget,
+            'total': sum(sum(usage.values()) for usage in tables.values()),
+            'buffer_pool_pages': buffer_pool.capacity,
+            'tables': tables,
+        }
+
+    """
+    # Apportions the budget and merges or saves tables until the pages held in memory fit in their part
+    # Returns the usage after enforcement
+    """
+    def enforce(self):
+        tables = dict(self.database.tables)
+        usages = {name: table.memory_usage() for name, table in tables.items()}
+        fixed = sum(usage['indexes'] + usage['directory'] for usage in usages.values())
+        available = max(0, self.budget - fixed)
+        cached = [name for name, table in tables.items() if table.is_loaded() and table.record_cache is not None]
+        for name in cached:
+            table = tables[name]
+            with table.latch:
+                table.record_cache.resize(int(available * RECORD_CACHE_SHARE / len(cached) // table.cached_record_bytes()))
+            usages[name] = table.memory_usage()
+        pages = available - sum(usage['record_cache'] for usage in usages.values())
+        in_memory = lambda: sum(usage['pages'] for usage in usages.values())
+        # Largest first, so as few tables as possible are merged or saved
+        for name in sorted(usages, key=lambda name: usages[name]['pages'], reverse=True):
+            if in_memory() <= pages or not usages[name]['pages']:
+                break
+            table = tables[name]
+            if table.merge(reclaiming=True):
+                if metrics.enabled:
+                    metrics.count("memory.merges")
+                usages[name] = table.memory_usage()
+            if usages[name]['pages'] and table.path is not None and in_memory() > pages and self.__may_spill(name):
+                table.save()
+                if metrics.enabled:
+                    metrics.count("memory.spills")
+                usages[name] = table.memory_usage()
+        if in_memory() <= pages:
+            self.spills = {}
+        buffer_pool.resize((pages - in_memory()) // PAGE_SIZE)
+        return self.usage()
+
+    """
+    # Whether a table may be saved to give its pages to the buffer pool. Saving rewrites the whole table
+    # under its latch, so a table is saved again only after a backoff, doubled each time it was saved
+    # while the budget was still exceeded, and reset once enforcement finds the budget met.
+    """
+    def __may_spill(self, name):
+        now = monotonic()
+        allowed, backoff = self.spills.get(name, (0, self.interval))
+        if now < allowed:
+            return False
+        self.spills[name] = (now + backoff, min(backoff * 2, MAX_SPILL_BACKOFF))
+        return True
+
+    def __check(self):
+        while not self.stopped.wait(self.interval):
+            self.enforce()
@@ -0,0 +1,112 @@
+from threading import Lock
+from functools import wraps
+from time import perf_counter
+
+# Latencies are bucketed by the bit length of their value in microseconds, i.e. in powers of two
+HISTOGRAM_BUCKETS = 40
+
+
+class Histogram:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.buckets[min(HISTOGRAM_BUCKETS - 1, int(seconds * 1e6).bit_length())] += 1
+
+    """
+    # Returns the upper bound, in seconds, of the bucket holding the given fraction of observations
+    """
+    def percentile(self, fraction):
+        threshold = fraction * self.count
+        seen = 0
+        for bucket, observations in enumerate(self.buckets):
+            seen += observations
+            if seen >= threshold:
+                return min(self.maximum, (1 << bucket) / 1e6)
+        return self.maximum
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": 1000 * self.total / self.count,
+            "p50_ms": 1000 * self.percentile(0.50),
+            "p95_ms": 1000 * self.percentile(0.95),
+            "p99_ms": 1000 * self.percentile(0.99),
+            "max_ms": 1000 * self.maximum,
+        }
+
+
+class Metrics:
+
+    """
+    # Process-wide registry of counters and latency histograms. Instrumentation points check enabled
+    # before doing anything, so a disabled registry costs one attribute lookup per point.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "latencies": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+
+metrics = Metrics()
+
+
+"""
+# Decorator recording the latency of every call of a method under name while metrics are enabled.
+# Keyword arguments are only forwarded when keywords is set, since accepting them costs a dict per call.
+"""
+def instrumented(name, keywords=False):
+    def decorate(method):
+        if keywords:
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return method(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    metrics.observe(name, perf_counter() - start)
+        else:
+            @wraps(method)
+            def wrapper(*args):
+                if not metrics.enabled:
+                    return method(*args)
+                start = perf_counter()
+                try:
+                    return method(*args)
+                finally:
+                    metrics.observe(name, perf_counter() - start)
+        return wrapper
+    return decorate
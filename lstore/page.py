@@ -1,14 +1,229 @@
+from lstore.config import PAGE_SIZE, PAGE_CAPACITY, CELL_SIZE
+from array import array
+from bisect import bisect_right
+
+# Unsigned array typecodes used to pack offsets, from the narrowest up
+PACKED_FORMATS = ((0xFF, 'B'), (0xFFFF, 'H'), (0xFFFFFFFF, 'I'), (0xFFFFFFFFFFFFFFFF, 'Q'))
+
 
 class Page:
 
     def __init__(self):
         self.num_records = 0
-        self.data = bytearray(4096)
+        self.data = bytearray(PAGE_SIZE)
+        # Signed 64-bit view over the raw bytes, one cell per record
+        self.cells = memoryview(self.data).cast('q')
 
     def has_capacity(self):
-        pass
+        return self.num_records < PAGE_CAPACITY
 
+    """
+    # Appends value to the page
+    # Returns the slot the value was written to
+    """
     def write(self, value):
+        slot = self.num_records
+        self.cells[slot] = value
         self.num_records += 1
-        pass
+        return slot
+
+    """
+    # Appends every value of an array('q') at once
+    # Returns the slot the first value was written to
+    """
+    def write_many(self, values):
+        slot = self.num_records
+        self.cells[slot:slot + len(values)] = values
+        self.num_records += len(values)
+        return slot
+
+    def read(self, slot):
+        return self.cells[slot]
+
+    """
+    # Overwrites the value in an existing slot, used for in-place metadata columns
+    """
+    def update(self, slot, value):
+        self.cells[slot] = value
+
+    def values(self):
+        return self.cells[:self.num_records].tolist()
+
+    """
+    # Returns the page as it is now, only fit for pickling, while the page itself keeps changing. Appends
+    # leave the values already written alone, so those are shared unless the page is overwritten in place.
+    :param overwritten: bool    #Copy the values, for metadata columns updated in place
+    """
+    def frozen(self, overwritten=False):
+        frozen = Page.__new__(Page)
+        frozen.num_records = self.num_records
+        frozen.data = self.data[:self.num_records * CELL_SIZE] if overwritten else self.data
+        return frozen
+
+    def size(self):
+        return PAGE_SIZE
+
+    # Only the used part of the page is pickled, the memoryview is rebuilt on load
+    def __getstate__(self):
+        return self.num_records, bytes(self.data[:self.num_records * CELL_SIZE])
+
+    def __setstate__(self, state):
+        self.num_records, used = state
+        self.data = bytearray(PAGE_SIZE)
+        self.data[:len(used)] = used
+        self.cells = memoryview(self.data).cast('q')
+
+    def sum(self):
+        return sum(self.cells[:self.num_records])
+
+    def min(self):
+        return min(self.cells[:self.num_records])
+
+    def max(self):
+        return max(self.cells[:self.num_records])
+
+
+"""
+Read-only encodings for base pages that are no longer appended to. They expose the same read
+interface as Page, and compute sum/min/max on the encoded data where the encoding allows it.
+"""
+
+def pack(offsets):
+    largest = max(offsets, default=0)
+    for limit, typecode in PACKED_FORMATS:
+        if largest <= limit:
+            return array(typecode, offsets)
+
+
+class RunLengthPage:
+
+    def __init__(self, values):
+        self.num_records = len(values)
+        self.run_values = []
+        # Exclusive end slot of every run
+        self.run_ends = []
+        for slot, value in enumerate(values):
+            if self.run_values and self.run_values[-1] == value:
+                self.run_ends[-1] = slot + 1
+            else:
+                self.run_values.append(value)
+                self.run_ends.append(slot + 1)
+
+    def has_capacity(self):
+        return False
+
+    def read(self, slot):
+        return self.run_values[bisect_right(self.run_ends, slot)]
+
+    def values(self):
+        values = []
+        start = 0
+        for value, end in zip(self.run_values, self.run_ends):
+            values.extend([value] * (end - start))
+            start = end
+        return values
+
+    def size(self):
+        return len(self.run_values) * 16
+
+    def sum(self):
+        total = 0
+        start = 0
+        for value, end in zip(self.run_values, self.run_ends):
+            total += value * (end - start)
+            start = end
+        return total
+
+    def min(self):
+        return min(self.run_values)
+
+    def max(self):
+        return max(self.run_values)
+
+
+class FrameOfReferencePage:
+
+    """
+    # Stores every value as an offset from the page minimum, packed into the narrowest integer width
+    """
+    def __init__(self, values):
+        self.num_records = len(values)
+        self.reference = min(values)
+        self.offsets = pack([value - self.reference for value in values])
+
+    def has_capacity(self):
+        return False
+
+    def read(self, slot):
+        return self.reference + self.offsets[slot]
+
+    def values(self):
+        reference = self.reference
+        return [reference + offset for offset in self.offsets]
+
+    def size(self):
+        return 8 + self.offsets.itemsize * self.num_records
+
+    def sum(self):
+        return self.reference * self.num_records + sum(self.offsets)
+
+    def min(self):
+        return self.reference
+
+    def max(self):
+        return self.reference + max(self.offsets)
+
+
+class DeltaPage:
+
+    # Every CHECKPOINT_INTERVAL-th value is stored in full so a read adds up at most that many deltas
+    CHECKPOINT_INTERVAL = 64
+
+    """
+    # Stores the differences between consecutive values of a non-decreasing column
+    """
+    def __init__(self, values):
+        self.num_records = len(values)
+        deltas = [current - previous for previous, current in zip(values, values[1:])]
+        self.min_delta = min(deltas, default=0)
+        self.deltas = pack([delta - self.min_delta for delta in deltas])
+        self.checkpoints = array('q', values[::self.CHECKPOINT_INTERVAL])
+
+    def has_capacity(self):
+        return False
+
+    def read(self, slot):
+        start = slot - slot % self.CHECKPOINT_INTERVAL
+        value = self.checkpoints[start // self.CHECKPOINT_INTERVAL]
+        return value + sum(self.deltas[start:slot]) + self.min_delta * (slot - start)
+
+    def values(self):
+        values = [self.checkpoints[0]]
+        min_delta = self.min_delta
+        for delta in self.deltas:
+            values.append(values[-1] + delta + min_delta)
+        return values
+
+    def size(self):
+        return 8 + self.deltas.itemsize * len(self.deltas) + 8 * len(self.checkpoints)
+
+    def sum(self):
+        return sum(self.values())
+
+    def min(self):
+        return self.checkpoints[0]
+
+    def max(self):
+        return self.read(self.num_records - 1)
+
 
+"""
+# Returns the smallest encoding of a full page, or the page itself if no encoding is smaller
+"""
+def compress(page):
+    values = page.values()
+    candidates = [RunLengthPage(values), FrameOfReferencePage(values)]
+    if all(previous <= current for previous, current in zip(values, values[1:])):
+        candidates.append(DeltaPage(values))
+    smallest = min(candidates, key=lambda candidate: candidate.size())
+    return smallest if smallest.size() < page.size() else page
@@ -0,0 +1,127 @@
+from threading import Lock, Thread, Event, get_ident
+import sys
+
+
+class TransactionProfile:
+
+    """
+    # Timings of a single attempt to run a transaction
+    :param worker: string       #Name of the thread that ran the attempt
+    :param wall: float          #Wall time of the attempt in seconds
+    :param cpu: float           #CPU time the running thread got during the attempt
+    :param lock_wait: float     #Time spent acquiring record locks
+    :param queries: list        #(query name, seconds) for every query executed
+    :param committed: bool      #Whether the attempt committed or aborted
+    """
+    def __init__(self, worker, wall, cpu, lock_wait, queries, committed):
+        self.worker = worker
+        self.wall = wall
+        self.cpu = cpu
+        self.lock_wait = lock_wait
+        self.queries = queries
+        self.committed = committed
+
+
+class Profiler:
+
+    """
+    # Collects per-transaction profiles from Transaction.run and, optionally, periodic stack samples of
+    # every thread. Comparing the buckets tells the causes of a slow multi-threaded run apart:
+    #   lock_wait   time inside lock acquisition
+    #   aborted     time of attempts lost to aborts on lock conflicts, each one retried by the worker
+    #   off_cpu     wall time the thread was not running, mostly waiting for the GIL
+    :param sample_interval: float   #Seconds between stack samples, None disables sampling
+    :param sample_path: string      #File the collapsed stacks are written to (flamegraph format)
+    """
+    def __init__(self, sample_interval=None, sample_path=None):
+        self.lock = Lock()
+        self.profiles = []
+        self.sample_interval = sample_interval
+        self.sample_path = sample_path
+        self.samples = {}
+        self.sampler = None
+        self.stopping = Event()
+
+    def record(self, profile):
+        with self.lock:
+            self.profiles.append(profile)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    """
+    # Starts the stack sampling thread, if sampling is enabled
+    """
+    def start(self):
+        if self.sample_interval is None or self.sampler is not None:
+            return
+        self.stopping.clear()
+        self.sampler = Thread(target=self.__sample, name="lstore-profiler", daemon=True)
+        self.sampler.start()
+
+    """
+    # Stops sampling and writes the collapsed stacks to sample_path
+    """
+    def stop(self):
+        if self.sampler is None:
+            return
+        self.stopping.set()
+        self.sampler.join()
+        self.sampler = None
+        if self.sample_path is not None:
+            with open(self.sample_path, "w") as output:
+                for stack, count in sorted(self.samples.items(), key=lambda item: -item[1]):
+                    output.write("%s %d\n" % (stack, count))
+
+    def __sample(self):
+        me = get_ident()
+        while not self.stopping.wait(self.sample_interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                try:
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        # f_lineno is None for a frame caught between two instructions
+                        stack.append("%s (%s:%s)" % (code.co_name, code.co_filename, frame.f_lineno or 0))
+                        frame = frame.f_back
+                except Exception:
+                    # A frame torn down while it is walked, sampling goes on with the next thread
+                    continue
+                key = ";".join(reversed(stack))
+                with self.lock:
+                    self.samples[key] = self.samples.get(key, 0) + 1
+
+    """
+    # Aggregates the recorded profiles into totals per worker and per query
+    """
+    def summary(self):
+        with self.lock:
+            profiles = list(self.profiles)
+            stack_samples = sum(self.samples.values())
+        queries = {}
+        workers = {}
+        for profile in profiles:
+            worker = workers.setdefault(profile.worker, {
+                "commits": 0, "aborts": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                "lock_wait_seconds": 0.0, "query_seconds": 0.0, "aborted_seconds": 0.0,
+            })
+            worker["commits" if profile.committed else "aborts"] += 1
+            worker["wall_seconds"] += profile.wall
+            worker["cpu_seconds"] += profile.cpu
+            worker["lock_wait_seconds"] += profile.lock_wait
+            if not profile.committed:
+                worker["aborted_seconds"] += profile.wall
+            for name, seconds in profile.queries:
+                worker["query_seconds"] += seconds
+                query = queries.setdefault(name, {"count": 0, "seconds": 0.0})
+                query["count"] += 1
+                query["seconds"] += seconds
+        for worker in workers.values():
+            worker["off_cpu_seconds"] = max(0.0, worker["wall_seconds"] - worker["cpu_seconds"])
+        return {"workers": workers, "queries": queries, "stack_samples": stack_samples}
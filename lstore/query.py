@@ -1,5 +1,29 @@
-from lstore.table import Table, Record
+from lstore.table import Table, Record, METADATA_COLUMNS, schema_mask
 from lstore.index import Index
+from lstore.transaction import running_transaction
+from lstore.metrics import metrics, instrumented
+from lstore.config import PAGE_CAPACITY
+
+# Aggregates supported by Query.aggregate
+AGGREGATE_OPS = ("count", "sum", "min", "max", "avg")
+
+
+# Changes staged by the deferred writes of optimistic transactions. Each maps the row a record has so far
+# in the transaction, None if it has none, to its new row, None to delete it, or False if the write fails.
+def _inserted(columns):
+    return lambda row: list(columns) if row is None else False
+
+
+def _updated(columns):
+    return lambda row: False if row is None else [old if new is None else new for old, new in zip(row, columns)]
+
+
+def _deleted(row):
+    return False if row is None else None
+
+
+def _added(column, delta):
+    return lambda row: False if row is None else [value + delta if position == column else value for position, value in enumerate(row)]
 
 
 class Query:
@@ -13,6 +37,100 @@ class Query:
         self.table = table
         pass
 
+    """
+    # Locks a record for the transaction running on this thread, if there is one
+    # Returns False if a conflicting transaction holds the lock
+    """
+    def __lock(self, rid, exclusive=False):
+        transaction = running_transaction()
+        if transaction is None:
+            return True
+        if transaction.reading:
+            # Optimistic transactions read without locks, only deferred writes take them
+            transaction.record_read(self.table, rid)
+            return True
+        return transaction.acquire(self.table.lock_manager, rid, exclusive)
+
+    def __lock_all(self, rids):
+        return all(self.__lock(rid) for rid in rids)
+
+    """
+    # Defers query(*args) to the commit of the running transaction if it is optimistic and still reading,
+    # staging its changes so the later reads of the transaction see them
+    :param changes: list    #(primary key, change) of every record written, change as _updated returns
+    # Returns None if the query is not deferred, True if it is, False if it fails on the staged rows
+    """
+    def __defer(self, query, args, changes):
+        transaction = running_transaction()
+        if transaction is None or not transaction.reading:
+            return None
+        for key, change in changes:
+            if not self.__stage(transaction, key, change):
+                return False
+        transaction.defer(query, args)
+        return True
+
+    def __stage(self, transaction, key, change):
+        row = change(self.__staged_row(transaction, key))
+        if row is False:
+            return False
+        if row is not None and row[self.table.key] != key:
+            # The record moves to another key, which has to be free
+            if self.__staged_row(transaction, row[self.table.key]) is not None:
+                return False
+            transaction.writes[(self.table, key)] = None
+            key = row[self.table.key]
+        transaction.writes[(self.table, key)] = row
+        return True
+
+    """
+    # Returns the row of the record with primary key as the running transaction sees it, None if there is none
+    """
+    def __staged_row(self, transaction, key):
+        staged = transaction.writes.get((self.table, key), False)
+        if staged is not False:
+            return staged
+        self.table.flush_inserts(transaction)
+        with self.table.latch:
+            rids = self.table.index.locate(self.table.key, key)
+            if not rids:
+                return None
+            transaction.record_read(self.table, rids[0])
+            return self.table.read(rids[0], range(self.table.num_columns))
+
+    """
+    # Returns primary key -> row, None if deleted, of the records of this table written by the running
+    # optimistic transaction, or None if there are none
+    """
+    def __staged_writes(self):
+        transaction = running_transaction()
+        if transaction is None or not transaction.reading or not transaction.writes:
+            return None
+        return {key: row for (table, key), row in transaction.writes.items() if table is self.table} or None
+
+    """
+    # Applies the writes staged by the running optimistic transaction to the records a select found:
+    # records it wrote are replaced or dropped, and those it gave search_key in search_key_index are added
+    """
+    def __overlay(self, records, search_key, search_key_index, projected_columns_index):
+        staged = self.__staged_writes()
+        if staged is None:
+            return records
+        rids = {record.key: record.rid for record in records}
+        records = [record for record in records if record.key not in staged]
+        for key, row in staged.items():
+            if row is not None and row[search_key_index] == search_key:
+                records.append(Record(rids.get(key), key, [value if projected else None for value, projected in zip(row, projected_columns_index)]))
+        return records
+
+    """
+    # Registers action(*args) to undo the current query if the running transaction aborts
+    """
+    def __log_undo(self, action, *args):
+        transaction = running_transaction()
+        if transaction is not None:
+            transaction.log_undo(action, *args)
+
     
     """
     # internal Method
@@ -20,8 +138,27 @@ class Query:
     # Returns True upon succesful deletion
     # Return False if record doesn't exist or is locked due to 2PL
     """
+    @instrumented("delete")
     def delete(self, primary_key):
-        pass
+        deferred = self.__defer(self.delete, (primary_key,), [(primary_key, _deleted)])
+        if deferred is not None:
+            return deferred
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            rids = self.table.index.locate(self.table.key, primary_key)
+            if not rids or not self.__lock(rids[0], True):
+                return False
+            rid = rids[0]
+            columns = self.table.read(rid, range(self.table.num_columns))
+            self.table.index.remove_entry(rid, columns)
+            self.table.delete_record(rid)
+            self.__log_undo(self.__undelete, rid, columns)
+            return True
+
+    def __undelete(self, rid, columns):
+        with self.table.latch:
+            self.table.restore_record(rid)
+            self.table.index.insert_entry(rid, columns)
     
     
     """
@@ -29,9 +166,41 @@ class Query:
     # Return True upon succesful insertion
     # Returns False if insert fails for whatever reason
     """
+    @instrumented("insert")
     def insert(self, *columns):
-        schema_encoding = '0' * self.table.num_columns
-        pass
+        schema_encoding = 0
+        if len(columns) != self.table.num_columns:
+            return False
+        deferred = self.__defer(self.insert, columns, [(columns[self.table.key], _inserted(columns))])
+        if deferred is not None:
+            return deferred
+        if self.table.insert_buffer_size:
+            return self.__buffer_insert(columns)
+        with self.table.latch:
+            if self.table.index.locate(self.table.key, columns[self.table.key]):
+                return False
+            rid = self.table.insert_record(columns, schema_encoding)
+            self.table.index.insert_entry(rid, columns)
+            self.__lock(rid, True)
+            self.__log_undo(self.delete, columns[self.table.key])
+            return True
+
+    
+    """
+    # Inserts into the calling thread's insert buffer, see Table.enable_insert_buffer
+    """
+    def __buffer_insert(self, columns):
+        transaction = running_transaction()
+        if not self.table.buffer_insert(columns, transaction):
+            return False
+        if transaction is not None:
+            transaction.buffered_tables.add(self.table)
+            self.__log_undo(self.__unbuffer, columns[self.table.key])
+        return True
+
+    def __unbuffer(self, key):
+        if not self.table.discard_insert(key):
+            self.delete(key)
 
     
     """
@@ -43,8 +212,9 @@ class Query:
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
+    @instrumented("select")
     def select(self, search_key, search_key_index, projected_columns_index):
-        pass
+        return self.__select(search_key, search_key_index, projected_columns_index, 0)
 
     
     """
@@ -57,8 +227,59 @@ class Query:
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
+    @instrumented("select_version")
     def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
-        pass
+        return self.__select(search_key, search_key_index, projected_columns_index, relative_version)
+
+    def __select(self, search_key, search_key_index, projected_columns_index, relative_version):
+        columns = [column for column, projected in enumerate(projected_columns_index) if projected]
+        if self.table.key not in columns:
+            columns.append(self.table.key)
+        records = []
+        cache = self.table.record_cache if relative_version == 0 else None
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            for rid in self.table.index.locate(search_key_index, search_key):
+                if not self.__lock(rid):
+                    return False
+                if cache is None:
+                    values = dict(zip(columns, self.table.read(rid, columns, relative_version)))
+                else:
+                    row = cache.get(rid)
+                    if row is None:
+                        row = self.table.read(rid, range(self.table.num_columns))
+                        cache.put(rid, row)
+                    values = {column: row[column] for column in columns}
+                projected = [values[column] if projected else None for column, projected in enumerate(projected_columns_index)]
+                records.append(Record(rid, values[self.table.key], projected))
+        if relative_version == 0:
+            records = self.__overlay(records, search_key, search_key_index, projected_columns_index)
+        return records
+
+    
+    """
+    # Read the record with the given primary key as it was at a point in time
+    # :param key: the primary key of the record
+    # :param timestamp: nanoseconds since the epoch, as stored in TIMESTAMP_COLUMN
+    # :param projected_columns_index: what columns to return. array of 1 or 0 values.
+    # Returns a list of Record objects upon success, empty if the record did not exist at that time
+    """
+    @instrumented("select_as_of")
+    def select_as_of(self, key, timestamp, projected_columns_index):
+        columns = [column for column, projected in enumerate(projected_columns_index) if projected]
+        records = []
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            for rid in self.table.index.locate(self.table.key, key):
+                if not self.__lock(rid):
+                    return False
+                values = self.table.read_as_of(rid, columns, timestamp)
+                if values is None:
+                    continue
+                values = dict(zip(columns, values))
+                projected = [values[column] if projected else None for column, projected in enumerate(projected_columns_index)]
+                records.append(Record(rid, key, projected))
+        return records
 
     
     """
@@ -66,8 +287,198 @@ class Query:
     # Returns True if update is succesful
     # Returns False if no records exist with given key or if the target record cannot be accessed due to 2PL locking
     """
+    @instrumented("update")
     def update(self, primary_key, *columns):
-        pass
+        if len(columns) != self.table.num_columns:
+            return False
+        deferred = self.__defer(self.update, (primary_key, *columns), [(primary_key, _updated(columns))])
+        if deferred is not None:
+            return deferred
+        return self.__update(primary_key, columns, None, None)
+
+    """
+    # Shared by update and prepared updates
+    :param indexed: list            #Updated columns that have an index, derived from columns if None
+    :param schema_encoding: int     #Schema encoding bitmask of columns, derived from columns if None
+    """
+    def __update(self, primary_key, columns, indexed, schema_encoding):
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            rids = self.table.index.locate(self.table.key, primary_key)
+            if not rids or not self.__lock(rids[0], True):
+                return False
+            key = columns[self.table.key]
+            if key is not None and key != primary_key and (self.table.index.locate(self.table.key, key) or key in self.table.buffered_keys):
+                return False
+            rid = rids[0]
+            undo = self.__undo_state(rid)
+            # Previous values of the updated columns that have to be moved in their indexes
+            if indexed is None:
+                indexed = [column for column, value in enumerate(columns) if value is not None and self.table.index.maintained[column]]
+            old_values = self.table.read(rid, indexed)
+            tail_rid = self.table.update_record(rid, columns, schema_encoding)
+            for column, old_value in zip(indexed, old_values):
+                self.table.index.update_entry(rid, column, old_value, columns[column])
+            self.__log_revert(rid, tail_rid, undo)
+            return True
+
+    """
+    # Returns what __log_revert needs to undo an update of the record about to be made, None outside of
+    # a transaction
+    """
+    def __undo_state(self, rid):
+        if running_transaction() is None:
+            return None
+        return self.table.rollback_state(rid), self.table.read(rid, range(self.table.num_columns))
+
+    def __log_revert(self, rid, tail_rid, undo):
+        if undo is not None:
+            self.__log_undo(self.__revert, rid, tail_rid, *undo)
+
+    """
+    # Removes the version an update of an aborted transaction added, see Table.rollback_update, and moves
+    # the index entries of the record back
+    """
+    def __revert(self, rid, tail_rid, state, previous):
+        table = self.table
+        with table.latch:
+            current = table.read(rid, range(table.num_columns))
+            table.rollback_update(rid, tail_rid, state)
+            for column, (old_value, new_value) in enumerate(zip(previous, current)):
+                if old_value != new_value and table.index.maintained[column]:
+                    table.index.update_entry(rid, column, new_value, old_value)
+
+    """
+    # Applies a batch of updates in order, coalescing all updates of a record into a single tail record,
+    # so the intermediate states within the batch do not become versions of their own
+    :param updates: list            #(primary_key, columns) pairs, columns as in Query.update
+    # Returns True if every update is succesful
+    # Returns False, without applying any of them, if an update would fail on its own
+    """
+    @instrumented("update_many")
+    def update_many(self, updates):
+        if any(len(columns) != self.table.num_columns for _, columns in updates):
+            return False
+        deferred = self.__defer(self.update_many, (updates,), [(primary_key, _updated(columns)) for primary_key, columns in updates])
+        if deferred is not None:
+            return deferred
+        key_column = self.table.key
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            # Base RID -> merged columns, and the keys given to or taken from records within the batch
+            pending = {}
+            keys = {}
+            for primary_key, columns in updates:
+                if len(columns) != self.table.num_columns:
+                    return False
+                if primary_key in keys:
+                    rid = keys[primary_key]
+                else:
+                    rids = self.table.index.locate(key_column, primary_key)
+                    rid = rids[0] if rids else None
+                if rid is None or not self.__lock(rid, True):
+                    return False
+                key = columns[key_column]
+                if key is not None and key != primary_key:
+                    if keys.get(key, self.table.index.locate(key_column, key) or None) is not None or key in self.table.buffered_keys:
+                        return False
+                    keys[primary_key] = None
+                    keys[key] = rid
+                merged = pending.setdefault(rid, [None] * self.table.num_columns)
+                for column, value in enumerate(columns):
+                    if value is not None:
+                        merged[column] = value
+            for rid, columns in pending.items():
+                undo = self.__undo_state(rid)
+                indexed = [column for column, value in enumerate(columns) if value is not None and self.table.index.maintained[column]]
+                old_values = self.table.read(rid, indexed)
+                tail_rid = self.table.update_record(rid, columns)
+                for column, old_value in zip(indexed, old_values):
+                    self.table.index.update_entry(rid, column, old_value, columns[column])
+                self.__log_revert(rid, tail_rid, undo)
+            if metrics.enabled:
+                metrics.count("update_many.coalesced", len(updates) - len(pending))
+            return True
+
+
+    """
+    # Prepares a select on a fixed column and projection for repeated use
+    # :param search_key_index: the column index you want to search based on
+    # :param projected_columns_index: what columns to return. array of 1 or 0 values.
+    # Returns a callable select(search_key) with the same results as Query.select
+    """
+    def prepare_select(self, search_key_index, projected_columns_index):
+        table = self.table
+        columns = [column for column, projected in enumerate(projected_columns_index) if projected]
+        if table.key not in columns:
+            columns.append(table.key)
+        positions = [columns.index(column) if projected else None for column, projected in enumerate(projected_columns_index)]
+        key_position = columns.index(table.key)
+        # Index serving the search column, re-resolved if indexes are created or dropped in the meantime
+        plan = [table.index.version, table.index.indices[search_key_index]]
+
+        @instrumented("select")
+        def select(search_key):
+            records = []
+            table.flush_inserts(running_transaction())
+            with table.latch:
+                if plan[0] != table.index.version:
+                    plan[:] = [table.index.version, table.index.indices[search_key_index]]
+                index = plan[1]
+                if index is None:
+                    rids = table.index.locate(search_key_index, search_key)
+                else:
+                    if metrics.enabled:
+                        metrics.count("index.lookups")
+                    rids = index.get(search_key, ())
+                cache = table.record_cache
+                for rid in rids:
+                    if not self.__lock(rid):
+                        return False
+                    if cache is None:
+                        row = table.read(rid, columns)
+                    else:
+                        full = cache.get(rid)
+                        if full is None:
+                            full = table.read(rid, range(table.num_columns))
+                            cache.put(rid, full)
+                        row = [full[column] for column in columns]
+                    records.append(Record(rid, row[key_position], [None if position is None else row[position] for position in positions]))
+            return self.__overlay(records, search_key, search_key_index, projected_columns_index)
+        return select
+
+    
+    """
+    # Prepares an update of a fixed set of columns for repeated use
+    # :param column_mask: which columns the update writes. array of 1 or 0 values.
+    # Returns a callable update(primary_key, *values) taking the new values of the masked columns in order,
+    # with the same results as Query.update, a None value leaving its column unchanged
+    """
+    def prepare_update(self, column_mask):
+        table = self.table
+        positions = [column for column, updated in enumerate(column_mask) if updated]
+        schema_encoding = schema_mask(positions)
+        template = [None] * table.num_columns
+        # Updated columns that have an index, re-resolved if indexes are created or dropped in the meantime
+        plan = [None, None]
+
+        @instrumented("update")
+        def update(primary_key, *values):
+            if len(values) != len(positions):
+                return False
+            columns = template.copy()
+            for column, value in zip(positions, values):
+                columns[column] = value
+            deferred = self.__defer(update, (primary_key, *values), [(primary_key, _updated(columns))])
+            if deferred is not None:
+                return deferred
+            if None in values:
+                # As in update, None leaves a column unchanged, so the plan does not apply to this call
+                return self.__update(primary_key, columns, None, None)
+            if plan[0] != table.index.version:
+                plan[:] = [table.index.version, [column for column in positions if table.index.maintained[column]]]
+            return self.__update(primary_key, columns, plan[1], schema_encoding)
+        return update
 
     
     """
@@ -78,8 +489,9 @@ class Query:
     # Returns the summation of the given range upon success
     # Returns False if no record exists in the given range
     """
+    @instrumented("sum")
     def sum(self, start_range, end_range, aggregate_column_index):
-        pass
+        return self.__sum(start_range, end_range, aggregate_column_index, 0)
 
     
     """
@@ -91,10 +503,136 @@ class Query:
     # Returns the summation of the given range upon success
     # Returns False if no record exists in the given range
     """
+    @instrumented("sum_version")
     def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
-        pass
+        return self.__sum(start_range, end_range, aggregate_column_index, relative_version)
+
+    def __sum(self, start_range, end_range, aggregate_column_index, relative_version):
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            result = self.__aggregate(start_range, end_range, aggregate_column_index, ("sum",), None, relative_version)
+        return result["sum"] if result else False
 
     
+    """
+    :param start_range: int         # Start of the key range to aggregate 
+    :param end_range: int           # End of the key range to aggregate 
+    :param aggregate_columns: int  # Index of desired column to aggregate
+    :param timestamp: int           # Point in time (nanoseconds since the epoch) to aggregate the records as of
+    # this function is only called on the primary key.
+    # Returns the summation of the given range upon success
+    # Returns False if no record existed in the given range at that time
+    """
+    @instrumented("sum_as_of")
+    def sum_as_of(self, start_range, end_range, aggregate_column_index, timestamp):
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            rids = self.table.index.locate_range(start_range, end_range, self.table.key)
+            if not self.__lock_all(rids):
+                return False
+            values = [self.table.read_as_of(rid, (aggregate_column_index,), timestamp) for rid in rids]
+        values = [value[0] for value in values if value is not None]
+        if not values:
+            return False
+        return sum(values)
+
+    
+    """
+    :param start_range: int             # Start of the key range to aggregate
+    :param end_range: int               # End of the key range to aggregate
+    :param aggregate_column_index: int  # Index of desired column to aggregate
+    :param ops: tuple                   # Names of the aggregates to compute: count, sum, min, max, avg
+    :param group_by: int                # Optional index of the column to group the records by
+    :param relative_version: int        # The relative version of the records to aggregate
+    # this function is only called on the primary key.
+    # Returns a dict of op -> result, or group value -> (op -> result) when grouping
+    # Returns False if no record exists in the given range or an op is unknown
+    """
+    @instrumented("aggregate", keywords=True)
+    def aggregate(self, start_range, end_range, aggregate_column_index, ops=("count", "min", "max", "avg"), group_by=None, relative_version=0):
+        if any(op not in AGGREGATE_OPS for op in ops):
+            return False
+        self.table.flush_inserts(running_transaction())
+        with self.table.latch:
+            return self.__aggregate(start_range, end_range, aggregate_column_index, ops, group_by, relative_version)
+
+    def __aggregate(self, start_range, end_range, aggregate_column_index, ops, group_by, relative_version):
+        staged = self.__staged_writes() if relative_version == 0 else None
+        if staged is not None:
+            return self.__aggregate_staged(start_range, end_range, aggregate_column_index, ops, group_by, staged)
+        if group_by is not None:
+            # Hash group-by: gather both columns in a single pass, then aggregate every group
+            groups = {}
+            columns = (aggregate_column_index, group_by)
+            rids = self.table.index.locate_range(start_range, end_range, self.table.key)
+            if not self.__lock_all(rids):
+                return False
+            for rid in rids:
+                value, group = self.table.read(rid, columns, relative_version)
+                groups.setdefault(group, []).append(value)
+            if not groups:
+                return False
+            return {group: self.__finish(self.__partial(values), ops) for group, values in groups.items()}
+        # A range narrower than a page cannot cover a whole base page set, so probing the index is cheaper.
+        # Transactions have to lock every record they read, so they always go through the index.
+        if relative_version == 0 and end_range - start_range + 1 >= PAGE_CAPACITY and running_transaction() is None:
+            page_sets, rids = self.table.partition_key_range(start_range, end_range)
+        else:
+            page_sets, rids = [], self.table.index.locate_range(start_range, end_range, self.table.key)
+            if not self.__lock_all(rids):
+                return False
+        # Whole page sets are aggregated on their pages, the remaining records one by one
+        partials = []
+        for page_set in page_sets:
+            page = page_set[METADATA_COLUMNS + aggregate_column_index]
+            partials.append((page.num_records, page.sum(), page.min(), page.max()))
+        if rids:
+            partials.append(self.__partial([self.table.read(rid, (aggregate_column_index,), relative_version)[0] for rid in rids]))
+        if not partials:
+            return False
+        counts, totals, minimums, maximums = zip(*partials)
+        return self.__finish((sum(counts), sum(totals), min(minimums), max(maximums)), ops)
+
+    """
+    # Aggregates the latest records of the range as the running optimistic transaction sees them, with the
+    # writes it staged applied
+    """
+    def __aggregate_staged(self, start_range, end_range, aggregate_column_index, ops, group_by, staged):
+        rids = self.table.index.locate_range(start_range, end_range, self.table.key)
+        if not self.__lock_all(rids):
+            return False
+        group_column = self.table.key if group_by is None else group_by
+        # Primary key -> (value, group) of every record in the range
+        rows = {}
+        for rid in rids:
+            key, value, group = self.table.read(rid, (self.table.key, aggregate_column_index, group_column))
+            rows[key] = (value, group)
+        for key, row in staged.items():
+            if start_range <= key <= end_range:
+                if row is None:
+                    rows.pop(key, None)
+                else:
+                    rows[key] = (row[aggregate_column_index], row[group_column])
+        if not rows:
+            return False
+        if group_by is None:
+            return self.__finish(self.__partial([value for value, _ in rows.values()]), ops)
+        groups = {}
+        for value, group in rows.values():
+            groups.setdefault(group, []).append(value)
+        return {group: self.__finish(self.__partial(values), ops) for group, values in groups.items()}
+
+    """
+    # Returns the (count, sum, min, max) of a list of values, which partial results combine from
+    """
+    def __partial(self, values):
+        return len(values), sum(values), min(values), max(values)
+
+    def __finish(self, partial, ops):
+        count, total, minimum, maximum = partial
+        results = {"count": count, "sum": total, "min": minimum, "max": maximum}
+        return {op: total / count if op == "avg" else results[op] for op in ops}
+
     """
     incremenets one column of the record
     this implementation should work if your select and update queries already work
@@ -103,11 +641,40 @@ class Query:
     # Returns True is increment is successful
     # Returns False if no record matches key or if target record is locked by 2PL.
     """
+    @instrumented("increment")
     def increment(self, key, column):
-        r = self.select(key, self.table.key, [1] * self.table.num_columns)[0]
-        if r is not False:
-            updated_columns = [None] * self.table.num_columns
-            updated_columns[column] = r[column] + 1
-            u = self.update(key, *updated_columns)
-            return u
-        return False
+        return self.__add(key, column, 1)
+
+    """
+    # Adds delta to one column of the record with the given key, locating the record once and reading
+    # only that column
+    # Returns True if the addition is succesful
+    # Returns False if no record matches key, the new key is taken, or the record is locked by 2PL
+    """
+    @instrumented("add")
+    def add(self, key, column, delta):
+        return self.__add(key, column, delta)
+
+    def __add(self, key, column, delta):
+        deferred = self.__defer(self.add, (key, column, delta), [(key, _added(column, delta))])
+        if deferred is not None:
+            return deferred
+        table = self.table
+        table.flush_inserts(running_transaction())
+        with table.latch:
+            rids = table.index.locate(table.key, key)
+            if not rids or not self.__lock(rids[0], True):
+                return False
+            rid = rids[0]
+            old_value = table.read(rid, (column,))[0]
+            new_value = old_value + delta
+            if column == table.key and delta and (table.index.locate(table.key, new_value) or new_value in table.buffered_keys):
+                return False
+            undo = self.__undo_state(rid)
+            columns = [None] * table.num_columns
+            columns[column] = new_value
+            tail_rid = table.update_record(rid, columns, 1 << column)
+            if table.index.maintained[column]:
+                table.index.update_entry(rid, column, old_value, new_value)
+            self.__log_revert(rid, tail_rid, undo)
+            return True
@@ -0,0 +1,114 @@
+from lstore.query import Query
+from collections import Counter
+
+# Key ranges of aggregates wider than this are not treated as conflicts, they would tie every group together
+MAX_SCHEDULED_RANGE = 64
+
+
+class TransactionScheduler:
+
+    """
+    # Distributes transactions over workers so that transactions touching the same records run on the
+    # same worker, one after the other, instead of aborting each other from different workers.
+    # Transactions are grouped by the primary keys their queries name, each group goes whole to the least
+    # loaded worker, largest groups first, and every worker keeps the order the transactions were added in.
+    # No group grows past the share of one worker: under skew, keys chain most transactions into a single
+    # group, which would leave the other workers idle. A transaction that would overflow a group joins
+    # the group of its most used key that still has room, or starts a new one for that key, and may
+    # conflict with transactions of other groups.
+    :param workers: list    #TransactionWorkers to distribute over
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.transactions = []
+
+    def add_transaction(self, transaction):
+        self.transactions.append(transaction)
+
+    """
+    # Hands the added transactions to the workers
+    # Returns the number of conflict groups formed
+    """
+    def schedule(self):
+        transactions, self.transactions = self.transactions, []
+        if not transactions:
+            return 0
+        share = -(-len(transactions) // len(self.workers))
+        keys = [self.keys(transaction) for transaction in transactions]
+        uses = Counter(key for transaction_keys in keys for key in transaction_keys)
+        # Union-find over transaction positions, joined whenever two transactions share a key and the
+        # joined group fits in a worker's share
+        parents = list(range(len(transactions)))
+        sizes = [1] * len(transactions)
+
+        def find(position):
+            while parents[position] != position:
+                parents[position] = parents[parents[position]]
+                position = parents[position]
+            return position
+
+        owners = {}
+        for position, transaction_keys in enumerate(keys):
+            for key in sorted(transaction_keys, key=uses.__getitem__, reverse=True):
+                root = find(position)
+                owner = find(owners.setdefault(key, position))
+                if owner == root:
+                    continue
+                if sizes[root] + sizes[owner] <= share:
+                    parents[root] = owner
+                    sizes[owner] += sizes[root]
+                else:
+                    # Later transactions on this key gather in this transaction's group instead
+                    owners[key] = position
+        groups = {}
+        for position in range(len(transactions)):
+            groups.setdefault(find(position), []).append(position)
+        loads = [0] * len(self.workers)
+        assignment = [None] * len(transactions)
+        for group in sorted(groups.values(), key=len, reverse=True):
+            worker = loads.index(min(loads))
+            loads[worker] += len(group)
+            for position in group:
+                assignment[position] = worker
+        for position, transaction in enumerate(transactions):
+            self.workers[assignment[position]].add_transaction(transaction)
+        return len(groups)
+
+    def run(self):
+        self.schedule()
+        for worker in self.workers:
+            worker.run()
+
+    def join(self):
+        for worker in self.workers:
+            worker.join()
+
+    """
+    # Returns the (table, primary key) pairs the queries of a transaction touch, as far as they can be told
+    # from the queued (query, args) tuples. Queries of unknown shape contribute no keys.
+    """
+    @staticmethod
+    def keys(transaction):
+        keys = set()
+        for query, args in transaction.queries:
+            # Look through wrappers such as the timing ones of benchmark.py for the Query method
+            while getattr(query, '__self__', None) is None and hasattr(query, '__wrapped__'):
+                query = query.__wrapped__
+            owner = getattr(query, '__self__', None)
+            if not isinstance(owner, Query):
+                continue
+            table = owner.table
+            name = query.__name__
+            if name in ("update", "delete", "increment", "add", "select_as_of"):
+                keys.add((table, args[0]))
+            elif name in ("select", "select_version"):
+                if args[1] == table.key:
+                    keys.add((table, args[0]))
+            elif name == "insert":
+                keys.add((table, args[table.key]))
+            elif name == "update_many":
+                keys.update((table, key) for key, _ in args[0])
+            elif name in ("sum", "sum_version", "sum_as_of", "aggregate"):
+                if args[1] - args[0] < MAX_SCHEDULED_RANGE:
+                    keys.update((table, key) for key in range(args[0], args[1] + 1))
+        return keys
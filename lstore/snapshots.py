@@ -0,0 +1,61 @@
+from threading import Condition
+from contextlib import contextmanager
+from itertools import count
+
+
+class SnapshotRegistry:
+
+    """
+    # Keeps the start timestamps of running readers (transactions), so version garbage collection
+    # never reclaims a version one of them may still need, and lets a database snapshot wait until none runs
+    """
+    def __init__(self):
+        self.lock = Condition()
+        self.tokens = count()
+        self.active = {}
+        self.quiescing = 0
+
+    """
+    # Registers a reader that started at timestamp and returns a token to release it with. Waits while the
+    # registry is quiesced.
+    """
+    def register(self, timestamp):
+        with self.lock:
+            while self.quiescing:
+                self.lock.wait()
+            token = next(self.tokens)
+            self.active[token] = timestamp
+        return token
+
+    def release(self, token):
+        with self.lock:
+            self.active.pop(token, None)
+            if not self.active:
+                self.lock.notify_all()
+
+    """
+    # Keeps new readers from registering and waits until every running one is released, for as long as the
+    # with block runs
+    """
+    @contextmanager
+    def quiesce(self):
+        with self.lock:
+            self.quiescing += 1
+            while self.active:
+                self.lock.wait()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.quiescing -= 1
+                self.lock.notify_all()
+
+    """
+    # Returns the start timestamp of the oldest running reader, or None if there is none
+    """
+    def oldest(self):
+        with self.lock:
+            return min(self.active.values(), default=None)
+
+
+snapshots = SnapshotRegistry()
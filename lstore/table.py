@@ -1,10 +1,59 @@
 from lstore.index import Index
-from time import time
+from lstore.page import Page, compress
+from lstore.bufferpool import PageUsage, PageFile, DiskPage, buffer_pool
+from lstore.cache import RecordCache
+from lstore.insert_buffer import InsertBuffer
+from lstore.columnar import write_header, write_chunk, write_end, ROWS, VERSIONS
+from lstore.snapshots import snapshots
+from lstore.lock_manager import LockManager
+from lstore.metrics import metrics
+from lstore.config import PAGE_SIZE, PAGE_CAPACITY, CELL_SIZE, BASE_PAGES_PER_RANGE, MERGE_THRESHOLD, COMPRESS_MERGED_PAGES, RECORD_CACHE_SIZE, VERSION_RETENTION, INSERT_BUFFER_SIZE, RID_BLOCK_SIZE
+from time import time_ns, perf_counter
+from bisect import bisect_right
+from operator import itemgetter
+from threading import RLock, Lock, local
+from weakref import finalize
+from array import array
+import json
+import os
+import pickle
+import shutil
 
 INDIRECTION_COLUMN = 0
 RID_COLUMN = 1
 TIMESTAMP_COLUMN = 2
 SCHEMA_ENCODING_COLUMN = 3
+METADATA_COLUMNS = 4
+
+# Kinds of record stored in the page directory
+BASE = 0
+TAIL = 1
+
+# Files of a persisted table inside its directory
+HEADER_FILE = 'header.json'
+STATE_FILE = 'state.pickle'
+PAGES_FILE = 'pages.dat'
+INDEX_FILE = 'indexes.dat'
+
+# Rough memory taken by an index entry (value and set of RIDs), and by a page directory or version index
+# entry, used to estimate the memory use of a table without measuring every entry
+INDEX_ENTRY_BYTES = 300
+DIRECTORY_ENTRY_BYTES = 150
+
+# Serializes the loading of lazily opened tables
+_load_lock = Lock()
+
+
+# Schema encodings are bitmasks with bit i set when column i has been updated
+def schema_mask(columns):
+    mask = 0
+    for column in columns:
+        mask |= 1 << column
+    return mask
+
+
+# Indirection value marking a deleted base record until merge compacts it away
+DELETED = -1
 
 
 class Record:
@@ -14,22 +63,1107 @@ class Record:
         self.key = key
         self.columns = columns
 
+
+class WriterLease:
+
+    """
+    # Kept in the thread-local storage of a thread inserting into a table, for as long as the thread lives
+    """
+    __slots__ = ('writer', '__weakref__')
+
+
+class PageRange:
+
+    """
+    A group of base page sets and the tail page sets holding their updates.
+    A page set is a list of pages, one per physical column (metadata first).
+    """
+    def __init__(self):
+        self.base_pages = []
+        self.tail_pages = []
+        # Zone map of each base page set: ([min per column], [max per column]) over the latest values
+        self.zone_maps = []
+        self.num_updates = 0
+        # Merges of the page range so far, telling rollback_update whether the base pages changed
+        self.merges = 0
+        # Base page sets holding records updated since the last merge
+        self.dirty = set()
+        # Tail records made unreachable by deletes, reclaimed when the tail pages are next compacted
+        self.garbage = 0
+        # Deleted records whose slots the next merge compacts away
+        self.deletes = 0
+        # Tail-page sequence number: every tail record with RID <= tps is already reflected in the base pages
+        self.tps = 0
+        # Block of RIDs reserved for the tail records of this range, which keeps them increasing within it
+        self.next_tail_rid = 0
+        self.tail_rid_limit = 0
+
+    def is_full(self):
+        return len(self.base_pages) == BASE_PAGES_PER_RANGE and not self.base_pages[-1][0].has_capacity()
+
+
 class Table:
 
     """
     :param name: string         #Table name
     :param num_columns: int     #Number of Columns: all columns are integer
     :param key: int             #Index of table key in columns
+    :param path: string         #Directory the table is persisted in, None for an in-memory table
+    # The methods below assume the caller holds latch, which serializes access to the pages,
+    # the page directory and the indexes. Transaction isolation is provided by lock_manager.
     """
-    def __init__(self, name, num_columns, key):
+    def __init__(self, name, num_columns, key, path=None):
         self.name = name
         self.key = key
         self.num_columns = num_columns
+        self.total_columns = num_columns + METADATA_COLUMNS
+        self.path = path
+        # Number of the last save, persisted indexes are only trusted if they carry the same number
+        self.checkpoint = 0
+        # RID -> (page range index, BASE/TAIL, page set index, slot)
         self.page_directory = {}
+        self.page_ranges = []
+        self.page_usage = PageUsage()
+        # First RID not reserved yet, RIDs are handed out in blocks of RID_BLOCK_SIZE
+        self.next_rid = 1
+        # [page range it inserts into, next RID of its block, end of its block] of every thread inserting,
+        # and those left by threads that ended, which new inserting threads take over
+        self.writers = []
+        self.idle_writers = []
+        # Those of threads that ended since the last call to _writer, which moves them to idle_writers
+        self.ended_writers = []
+        self.thread_writers = local()
+        # Base RIDs of deleted records whose slots and tail records have been reclaimed by a merge
+        self.free_rids = []
+        # Base RID -> (indirection before the delete, location) of deleted records the next merge has not
+        # reclaimed yet, which restore_record can bring back
+        self.deleted = {}
+        self.last_timestamp = 0
+        # Base RID -> ([commit timestamps], [tail RIDs]) of every version of an updated record, oldest first
+        self.version_index = {}
+        # Previous versions per record that garbage collection keeps for select_version, None keeps all
+        self.version_retention = VERSION_RETENTION
         self.index = Index(self)
+        self.latch = RLock()
+        self.lock_manager = LockManager()
+        self.record_cache = None
+        self.enable_record_cache(RECORD_CACHE_SIZE)
+        # Insert buffer of every thread that inserted, and the keys of the rows they hold, each reserved
+        # by the columns object of its insert
+        self.insert_buffers = []
+        self.buffered_keys = {}
+        self.thread_buffers = local()
+        self.insert_buffer_size = 0
+        self.enable_insert_buffer(INSERT_BUFFER_SIZE)
         pass
 
-    def __merge(self):
-        print("merge is happening")
-        pass
- 
+    """
+    # Returns a table persisted in path without reading anything but its small header. The page directory,
+    # pages and indexes are loaded the first time any other attribute of the table is used.
+    :param indexed_columns: list    #Columns that had an index when the table was saved
+    """
+    @classmethod
+    def open(cls, name, num_columns, key, path, indexed_columns):
+        table = cls.__new__(cls)
+        table.name = name
+        table.key = key
+        table.num_columns = num_columns
+        table.total_columns = num_columns + METADATA_COLUMNS
+        table.path = path
+        with open(os.path.join(path, HEADER_FILE)) as header:
+            table._pending = (json.load(header), indexed_columns)
+        return table
+
+    def __getattr__(self, name):
+        # Only reached for missing attributes, which on a lazily opened table means it is first used now
+        if self.__dict__.get('_pending') is None:
+            raise AttributeError(name)
+        with _load_lock:
+            if self.__dict__.get('_pending') is not None:
+                self.__load()
+        return getattr(self, name)
+
+    def is_loaded(self):
+        return self.__dict__.get('_pending') is None
+
+    """
+    # Reads the state of a lazily opened table, its pages are left to the buffer pool. The persisted indexes
+    # are used if they were written by the same save as the header, otherwise they are rebuilt from the data.
+    # The page directory and version index are unpickled whole, so this takes time in proportion to the
+    # number of records.
+    """
+    def __load(self):
+        header, indexed_columns = self._pending
+        table = Table(self.name, self.num_columns, self.key, self.path)
+        with open(os.path.join(self.path, STATE_FILE), 'rb') as state_file:
+            state = pickle.load(state_file)
+        file = PageFile(os.path.join(self.path, PAGES_FILE), table.page_usage)
+        disk_pages = lambda page_sets: [[DiskPage((file, *location), column) for column, location in enumerate(page_set)] for page_set in page_sets]
+        for range_state in state['page_ranges']:
+            page_range = PageRange()
+            page_range.__dict__.update(range_state)
+            page_range.base_pages = disk_pages(range_state['base_pages'])
+            page_range.tail_pages = disk_pages(range_state['tail_pages'])
+            table.page_ranges.append(page_range)
+        table.__order_pages(file)
+        table.page_directory = state['page_directory']
+        table.version_index = state['version_index']
+        table.free_rids = state['free_rids']
+        table.next_rid = header['next_rid']
+        table.last_timestamp = header['last_timestamp']
+        table.version_retention = header['version_retention']
+        table.checkpoint = header.get('checkpoint', 0)
+        if table.index.load(os.path.join(self.path, INDEX_FILE), table.checkpoint, indexed_columns):
+            if metrics.enabled:
+                metrics.count("index.loads")
+        else:
+            if metrics.enabled:
+                metrics.count("index.rebuilds")
+            for column in indexed_columns:
+                if table.index.indices[column] is None:
+                    table.index.indices[column] = {}
+            table.index.rebuild()
+        # Publish everything at once, then point the index back at this object
+        self.__dict__.update(table.__dict__)
+        self.index.table = self
+        del self._pending
+
+    """
+    # Writes the table to its directory: a small JSON header, the pickled page directory and page range
+    # metadata, a pages file holding every pickled page, referenced from the metadata by offset, and the
+    # indexes. Every save bumps the checkpoint number, and the header, which carries it, is swapped in last.
+    # Afterwards every page is backed by the new pages file, so the buffer pool may evict it.
+    """
+    def save(self):
+        if not self.is_loaded():
+            return
+        self.flush_inserts()
+        os.makedirs(self.path, exist_ok=True)
+        with self.latch:
+            with open(os.path.join(self.path, PAGES_FILE + '.tmp'), 'wb') as pages_file:
+                def store(page):
+                    if isinstance(page, DiskPage):
+                        # Clean pages are copied from the current file without being read into the buffer pool
+                        blob = pickle.dumps(page.page, pickle.HIGHEST_PROTOCOL) if page.dirty else page.blob()
+                    else:
+                        blob = pickle.dumps(page, pickle.HIGHEST_PROTOCOL)
+                    offset = pages_file.tell()
+                    pages_file.write(blob)
+                    return offset, len(blob)
+                base_locations = self.__store_columns([page_range.base_pages for page_range in self.page_ranges], store)
+                tail_locations = self.__store_columns([page_range.tail_pages for page_range in self.page_ranges], store)
+                page_ranges = []
+                for page_range, base_pages, tail_pages in zip(self.page_ranges, base_locations, tail_locations):
+                    range_state = dict(vars(page_range))
+                    range_state['base_pages'] = base_pages
+                    range_state['tail_pages'] = tail_pages
+                    page_ranges.append(range_state)
+            state = {
+                'page_directory': self.page_directory,
+                'version_index': self.version_index,
+                'free_rids': self.free_rids,
+                'page_ranges': page_ranges,
+            }
+            with open(os.path.join(self.path, STATE_FILE + '.tmp'), 'wb') as state_file:
+                pickle.dump(state, state_file, pickle.HIGHEST_PROTOCOL)
+            self.checkpoint += 1
+            self.index.save(os.path.join(self.path, INDEX_FILE + '.tmp'), self.checkpoint)
+            header = {
+                'next_rid': self.next_rid,
+                'last_timestamp': self.last_timestamp,
+                'version_retention': self.version_retention,
+                'checkpoint': self.checkpoint,
+            }
+            with open(os.path.join(self.path, HEADER_FILE + '.tmp'), 'w') as header_file:
+                json.dump(header, header_file)
+            for name in (PAGES_FILE, STATE_FILE, INDEX_FILE, HEADER_FILE):
+                os.replace(os.path.join(self.path, name + '.tmp'), os.path.join(self.path, name))
+            file = PageFile(os.path.join(self.path, PAGES_FILE), self.page_usage)
+            # Every page is backed by the new file from here on, the dirty ones are handed to the buffer pool
+            self.page_usage.pages = 0
+            for page_range, base_pages, tail_pages in zip(self.page_ranges, base_locations, tail_locations):
+                for page_sets, locations in ((page_range.base_pages, base_pages), (page_range.tail_pages, tail_pages)):
+                    for page_set, page_locations in zip(page_sets, locations):
+                        for column, location in enumerate(page_locations):
+                            page = page_set[column]
+                            if isinstance(page, DiskPage):
+                                page.location = (file, *location)
+                            else:
+                                page = page_set[column] = DiskPage((file, *location), column, page)
+                            if page.page is not None:
+                                buffer_pool.unpin(page)
+            self.__order_pages(file)
+
+    """
+    # Stores the pages of every page set column by column across all page ranges, so that a scan of a
+    # column reads the pages file sequentially
+    # Returns the location store gave each page, laid out like the page sets
+    """
+    def __store_columns(self, page_sets_per_range, store):
+        locations = [[[None] * self.total_columns for _ in page_sets] for page_sets in page_sets_per_range]
+        for column in range(self.total_columns):
+            for page_sets, range_locations in zip(page_sets_per_range, locations):
+                for page_set, page_locations in zip(page_sets, range_locations):
+                    page_locations[column] = store(page_set[column])
+        return locations
+
+    """
+    # Captures the table as save would write it, for write_capture to serialize and write out later while the
+    # table keeps changing, so the latch is only held to take references. Pages backed by a pages file are
+    # captured by location, as a pages file is never modified once written and stays readable through its
+    # PageFile after a later save replaces it. Pages in memory are captured as frozen pages: a merge replaces
+    # base pages rather than rewriting them, and only the indirection and schema encoding columns of base
+    # pages are overwritten in place, so only those are copied. The page directory and the version lists are
+    # copied, the page range metadata, a few entries per page set, is pickled. A table that was never loaded
+    # is captured as its open files.
+    # The indexes are not captured, a table restored from the capture rebuilds them when it is loaded.
+    """
+    def capture(self):
+        with _load_lock:
+            if not self.is_loaded():
+                files = {}
+                for name in (HEADER_FILE, STATE_FILE, PAGES_FILE, INDEX_FILE):
+                    if os.path.exists(os.path.join(self.path, name)):
+                        files[name] = open(os.path.join(self.path, name), 'rb')
+                return {'files': files, 'indexes': self._pending[1]}
+        self.flush_inserts()
+        with self.latch:
+            def capture_page(page, overwritten=False):
+                if isinstance(page, DiskPage):
+                    if not page.dirty:
+                        return page.location
+                    page = page.page
+                # Encoded pages are never written to
+                return page.frozen(overwritten) if isinstance(page, Page) else page
+
+            def capture_base(page_set):
+                return [capture_page(page, column in (INDIRECTION_COLUMN, SCHEMA_ENCODING_COLUMN)) for column, page in enumerate(page_set)]
+
+            page_ranges = []
+            for page_range in self.page_ranges:
+                range_state = dict(vars(page_range))
+                del range_state['base_pages'], range_state['tail_pages']
+                page_ranges.append(range_state)
+            versions = list(self.version_index.values())
+            return {
+                'header': {
+                    'next_rid': self.next_rid,
+                    'last_timestamp': self.last_timestamp,
+                    'version_retention': self.version_retention,
+                    'checkpoint': self.checkpoint,
+                },
+                'page_directory': dict(self.page_directory),
+                # Base RIDs, then their timestamps and tail RIDs, which updates append to in place
+                'version_index': (list(self.version_index), list(map(list, map(itemgetter(0), versions))), list(map(list, map(itemgetter(1), versions)))),
+                'free_rids': list(self.free_rids),
+                'page_ranges': pickle.dumps(page_ranges, pickle.HIGHEST_PROTOCOL),
+                'base_pages': [[capture_base(page_set) for page_set in page_range.base_pages] for page_range in self.page_ranges],
+                'tail_pages': [[[capture_page(page) for page in page_set] for page_set in page_range.tail_pages] for page_range in self.page_ranges],
+                'indexes': [column for column, index in enumerate(self.index.indices) if index is not None],
+            }
+
+    """
+    # Writes a capture of the table to the directory path, in the layout save uses, without the latch
+    """
+    def write_capture(self, captured, path):
+        os.makedirs(path)
+        if 'files' in captured:
+            for name, source in captured['files'].items():
+                with source, open(os.path.join(path, name), 'wb') as target:
+                    shutil.copyfileobj(source, target)
+            return
+        with open(os.path.join(path, PAGES_FILE), 'wb') as pages_file:
+            def store(page):
+                if isinstance(page, tuple):
+                    file, offset, length = page
+                    blob = file.read(offset, length)
+                else:
+                    blob = pickle.dumps(page, pickle.HIGHEST_PROTOCOL)
+                offset = pages_file.tell()
+                pages_file.write(blob)
+                return offset, len(blob)
+            base_locations = self.__store_columns(captured['base_pages'], store)
+            tail_locations = self.__store_columns(captured['tail_pages'], store)
+        page_ranges = pickle.loads(captured['page_ranges'])
+        for range_state, base_pages, tail_pages in zip(page_ranges, base_locations, tail_locations):
+            range_state['base_pages'] = base_pages
+            range_state['tail_pages'] = tail_pages
+        rids, timestamps, tail_rids = captured['version_index']
+        state = {
+            'page_directory': captured['page_directory'],
+            'version_index': dict(zip(rids, zip(timestamps, tail_rids))),
+            'free_rids': captured['free_rids'],
+            'page_ranges': page_ranges,
+        }
+        with open(os.path.join(path, STATE_FILE), 'wb') as state_file:
+            pickle.dump(state, state_file, pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(path, HEADER_FILE), 'w') as header_file:
+            json.dump(captured['header'], header_file)
+
+    """
+    # Numbers the pages stored in file in file order, which read-ahead follows
+    """
+    def __order_pages(self, file):
+        for page_range in self.page_ranges:
+            for page_set in page_range.base_pages + page_range.tail_pages:
+                file.pages.extend(page_set)
+        file.pages.sort(key=lambda page: page.location[1])
+        for position, page in enumerate(file.pages):
+            page.position = position
+
+    """
+    # Writes the records of the table to path in the columnar format of lstore.columnar, one chunk per page
+    # range, so it can be loaded elsewhere with Database.import_table
+    :param history: bool        #Also export the previous versions of every record, for select_version
+    """
+    def export(self, path, history=False):
+        self.flush_inserts()
+        with self.latch, open(path, 'wb') as file:
+            write_header(file, {
+                'name': self.name,
+                'num_columns': self.num_columns,
+                'key': self.key,
+                'indexes': [column for column, index in enumerate(self.index.indices) if index is not None],
+                'history': history,
+            })
+            exported = 0
+            for page_range in self.page_ranges:
+                rows = [array('q') for _ in range(self.num_columns)]
+                # Ordinal of the record among the exported rows, then its values
+                versions = [array('q') for _ in range(self.num_columns + 1)]
+
+                def tail_row(tail_rid):
+                    _, _, page_index, slot = self.page_directory[tail_rid]
+                    return [page.read(slot) for page in page_range.tail_pages[page_index][METADATA_COLUMNS:]]
+
+                for page_index, page_set in enumerate(page_range.base_pages):
+                    live = [slot for slot, indirection in enumerate(page_set[INDIRECTION_COLUMN].values()) if indirection != DELETED]
+                    if not history and page_index not in page_range.dirty:
+                        # Nothing was updated since the last merge, the base pages hold the latest values
+                        for column, page in zip(rows, page_set[METADATA_COLUMNS:]):
+                            values = page.values()
+                            column.extend([values[slot] for slot in live])
+                        exported += len(live)
+                        continue
+                    rids = page_set[RID_COLUMN].values()
+                    for slot in live:
+                        rid = rids[slot]
+                        tail_rids = self.version_index[rid][1] if history and rid in self.version_index else None
+                        if tail_rids is None:
+                            row = self.read(rid, range(self.num_columns))
+                        else:
+                            # The oldest version kept goes into the rows, the later ones are replayed on import
+                            row = tail_row(tail_rids[0])
+                            for tail_rid in tail_rids[1:]:
+                                versions[0].append(exported)
+                                for column, value in zip(versions[1:], tail_row(tail_rid)):
+                                    column.append(value)
+                        for column, value in zip(rows, row):
+                            column.append(value)
+                        exported += 1
+                if rows[0]:
+                    write_chunk(file, ROWS, rows)
+                if versions[0]:
+                    write_chunk(file, VERSIONS, versions)
+            write_end(file, exported)
+
+    """
+    # Returns the catalog entry describing this table
+    """
+    def catalog_entry(self):
+        if not self.is_loaded():
+            indexed_columns = self._pending[1]
+        else:
+            indexed_columns = [column for column, index in enumerate(self.index.indices) if index is not None]
+        return {
+            'num_columns': self.num_columns,
+            'key': self.key,
+            'directory': os.path.basename(self.path),
+            'indexes': indexed_columns,
+        }
+
+    """
+    # Lets every thread buffer up to capacity inserted rows before they are written in bulk, or stops
+    # buffering if capacity is 0. Rows inserted outside transactions are flushed before any query reads the
+    # table, rows of a transaction before its own queries read it and when it commits, so other transactions
+    # never see them uncommitted.
+    """
+    def enable_insert_buffer(self, capacity):
+        self.flush_inserts()
+        self.insert_buffer_size = capacity
+
+    """
+    # Buffers an inserted row in the calling thread's insert buffer, only taking the latch to reserve its key
+    # Returns False if the key is already taken
+    :param columns: tuple       #Values of the user columns
+    :param owner: Transaction   #Transaction inserting the row, which gets its lock once the row is flushed
+    """
+    def buffer_insert(self, columns, owner):
+        key = columns[self.key]
+        # Under the latch, so that no update can give a record this key between the check and the reservation
+        with self.latch:
+            if key in self.buffered_keys or self.index.locate(self.key, key):
+                return False
+            self.buffered_keys[key] = columns
+        buffer = getattr(self.thread_buffers, 'buffer', None)
+        if buffer is None:
+            buffer = self.thread_buffers.buffer = InsertBuffer(self.num_columns)
+            with self.latch:
+                self.insert_buffers.append(buffer)
+        if buffer.append(columns, owner) >= self.insert_buffer_size:
+            self.flush_inserts(owner)
+        return True
+
+    """
+    # Drops a buffered row that was not flushed yet
+    # Returns False if no row with the key is buffered
+    """
+    def discard_insert(self, key):
+        for buffer in self.insert_buffers:
+            if buffer.discard(self.key, key):
+                del self.buffered_keys[key]
+                return True
+        return False
+
+    """
+    # Writes the buffered rows inserted outside transactions, and those of owner, to the base pages and the
+    # indexes. Rows of other transactions stay buffered, and invisible, until they commit. The rows of owner
+    # are exclusively locked for it, new records never carry a lock so this cannot conflict.
+    :param owner: Transaction   #Transaction running on the calling thread, None outside transactions
+    """
+    def flush_inserts(self, owner=None):
+        if not self.buffered_keys:
+            return
+        with self.latch:
+            for buffer in self.insert_buffers:
+                columns, owners = buffer.take(owner)
+                if not owners:
+                    continue
+                rids = self.insert_records(columns)
+                for rid, row, row_owner in zip(rids, zip(*columns), owners):
+                    self.index.insert_entry(rid, row)
+                    if row_owner is not None and not row_owner.acquire(self.lock_manager, rid, True):
+                        raise RuntimeError("new record %d of table %s is locked" % (rid, self.name))
+                for key in columns[self.key]:
+                    del self.buffered_keys[key]
+                if metrics.enabled:
+                    metrics.count("insert_buffer.flushed", len(owners))
+
+    """
+    # Puts a bounded cache of latest record versions in front of select, or removes it if capacity is 0
+    """
+    def enable_record_cache(self, capacity):
+        self.record_cache = RecordCache(capacity) if capacity > 0 else None
+
+    """
+    # Estimates the memory used by the table in bytes, by kind:
+    #   pages           pages only held in memory, those of a table that is not persisted and modified pages
+    #   buffered_pages  clean pages of a persisted table kept by the buffer pool, which may evict them
+    #   indexes         entries of the indexes
+    #   directory       page directory and version index entries
+    #   record_cache    records in the record cache
+    # Page bytes are read from the PageUsage counters of the table rather than by walking its pages.
+    # Dictionary entries are counted at a rough average size rather than measured one by one.
+    """
+    def memory_usage(self):
+        usage = {'pages': 0, 'buffered_pages': 0, 'indexes': 0, 'directory': 0, 'record_cache': 0}
+        if not self.is_loaded():
+            return usage
+        with self.latch:
+            usage['pages'] = self.page_usage.pages
+            usage['buffered_pages'] = self.page_usage.buffered_pages
+            for index in self.index.indices:
+                if index is not None:
+                    usage['indexes'] += len(index) * INDEX_ENTRY_BYTES
+            usage['directory'] = len(self.page_directory) * DIRECTORY_ENTRY_BYTES + len(self.version_index) * DIRECTORY_ENTRY_BYTES
+            if self.record_cache is not None:
+                usage['record_cache'] = len(self.record_cache.records) * self.cached_record_bytes()
+        return usage
+
+    """
+    # Returns the bytes of the pages in page_sets that count towards PageUsage.pages
+    """
+    @staticmethod
+    def __page_bytes(page_sets):
+        total = 0
+        for page_set in page_sets:
+            for page in page_set:
+                if not isinstance(page, DiskPage):
+                    total += page.size()
+                elif page.dirty:
+                    total += page.page.size()
+        return total
+
+    def cached_record_bytes(self):
+        return DIRECTORY_ENTRY_BYTES + self.num_columns * CELL_SIZE
+
+    """
+    # Merges the page ranges holding updates or deletes that were not merged yet, which compresses their
+    # full base pages and collects their old tail records. The latch is taken for one page range at a time.
+    :param reclaiming: bool     #Only merge page ranges where the merge frees memory: with deleted records,
+                                #unreachable tail records, or versions past the retention to collect
+    # Returns the number of page ranges merged
+    """
+    def merge(self, reclaiming=False):
+        merged = 0
+        for range_index in range(len(self.page_ranges)):
+            with self.latch:
+                page_range = self.page_ranges[range_index]
+                if not page_range.num_updates:
+                    continue
+                if reclaiming and not (page_range.deletes or page_range.garbage or self.version_retention is not None):
+                    continue
+                self.__merge(range_index)
+                merged += 1
+        return merged
+
+    """
+    # Reserves count consecutive RIDs and returns the first one
+    """
+    def reserve_rids(self, count):
+        rid = self.next_rid
+        self.next_rid += count
+        return rid
+
+    """
+    # Returns the state of the calling thread as a writer, giving it a page range of its own to insert into
+    # so concurrent inserters do not append to the same pages. A thread starting to insert takes over the
+    # last page range if no other thread is filling it. When the thread ends, its page range and what is left
+    # of its RID block go to the next thread that starts inserting.
+    """
+    def _writer(self):
+        while self.ended_writers:
+            writer = self.ended_writers.pop()
+            self.writers.remove(writer)
+            self.idle_writers.append(writer)
+        lease = getattr(self.thread_writers, 'lease', None)
+        if lease is None:
+            lease = self.thread_writers.lease = WriterLease()
+            lease.writer = self.idle_writers.pop() if self.idle_writers else [None, 0, 0]
+            self.writers.append(lease.writer)
+            # Thread-local storage is cleared when the thread ends, which drops the lease. The finalizer must
+            # not take the latch: it also runs in a forked child, where the latch may be held by a thread
+            # that does not exist there
+            finalize(lease, self.ended_writers.append, lease.writer)
+        writer = lease.writer
+        if writer[0] is None or self.page_ranges[writer[0]].is_full():
+            last = len(self.page_ranges) - 1
+            if last < 0 or self.page_ranges[last].is_full() or any(other[0] == last for other in self.writers):
+                self.page_ranges.append(PageRange())
+                last += 1
+            writer[0] = last
+        return writer
+
+    """
+    # Returns a RID for a new base record, from the calling thread's block
+    """
+    def new_rid(self, writer):
+        if writer[1] == writer[2]:
+            writer[1] = self.reserve_rids(RID_BLOCK_SIZE)
+            writer[2] = writer[1] + RID_BLOCK_SIZE
+        rid = writer[1]
+        writer[1] += 1
+        return rid
+
+    """
+    # Returns a RID for a new tail record of page_range, from the range's block
+    """
+    def new_tail_rid(self, page_range):
+        if page_range.next_tail_rid == page_range.tail_rid_limit:
+            page_range.next_tail_rid = self.reserve_rids(RID_BLOCK_SIZE)
+            page_range.tail_rid_limit = page_range.next_tail_rid + RID_BLOCK_SIZE
+        rid = page_range.next_tail_rid
+        page_range.next_tail_rid += 1
+        return rid
+
+    """
+    # Returns a strictly increasing timestamp in nanoseconds, so versions of a record never tie
+    """
+    def timestamp(self):
+        self.last_timestamp = max(self.last_timestamp + 1, time_ns())
+        return self.last_timestamp
+
+    """
+    # Returns the index of the last page set in page_sets, appending a new one if it is full
+    """
+    def _writable_page_set(self, page_sets):
+        if not page_sets or not page_sets[-1][0].has_capacity():
+            page_sets.append([Page() for _ in range(self.total_columns)])
+            self.page_usage.pages += self.total_columns * PAGE_SIZE
+        return len(page_sets) - 1
+
+    """
+    # Widens the zone map of a base page set so that it covers values (None entries are skipped)
+    """
+    def _widen_zone_map(self, zone_map, values):
+        mins, maxs = zone_map
+        for column, value in enumerate(values):
+            if value is None:
+                continue
+            if value < mins[column]:
+                mins[column] = value
+            if value > maxs[column]:
+                maxs[column] = value
+
+    def _write(self, page_set, values):
+        for page, value in zip(page_set, values):
+            slot = page.write(value)
+        return slot
+
+    """
+    # Iterates over the RIDs of all base records
+    """
+    def base_rids(self):
+        return [rid for rid, location in self.page_directory.items() if location[1] == BASE]
+
+    """
+    # Takes up to count RIDs of deleted records for reuse. RIDs still locked by the transaction that deleted
+    # the record are kept for later, so a new record never starts out locked.
+    """
+    def _reuse_rids(self, count):
+        locked = self.lock_manager.locks
+        reused = []
+        kept = []
+        while self.free_rids and len(reused) < count:
+            rid = self.free_rids.pop()
+            (kept if rid in locked else reused).append(rid)
+        self.free_rids.extend(kept)
+        return reused
+
+    """
+    # Appends a new base record and returns its RID
+    :param columns: list        #Values of the user columns
+    :param schema_encoding: int #Initial schema encoding of the record
+    """
+    def insert_record(self, columns, schema_encoding):
+        writer = self._writer()
+        range_index = writer[0]
+        page_range = self.page_ranges[range_index]
+        page_index = self._writable_page_set(page_range.base_pages)
+        if page_index == len(page_range.zone_maps):
+            page_range.zone_maps.append((list(columns), list(columns)))
+        else:
+            self._widen_zone_map(page_range.zone_maps[page_index], columns)
+        reused = self._reuse_rids(1)
+        rid = reused[0] if reused else self.new_rid(writer)
+        slot = self._write(page_range.base_pages[page_index], [0, rid, self.timestamp(), schema_encoding, *columns])
+        self.page_directory[rid] = (range_index, BASE, page_index, slot)
+        return rid
+
+    """
+    # Appends new base records a page at a time and returns their RIDs. Indexes are left to the caller.
+    :param columns: list        #One array('q') of values per user column, all of the same length
+    """
+    def insert_records(self, columns):
+        count = len(columns[0])
+        rids = []
+        position = 0
+        while position < count:
+            range_index = self._writer()[0]
+            page_range = self.page_ranges[range_index]
+            page_index = self._writable_page_set(page_range.base_pages)
+            page_set = page_range.base_pages[page_index]
+            size = min(count - position, PAGE_CAPACITY - page_set[0].num_records)
+            values = [column[position:position + size] for column in columns]
+            mins = [min(column) for column in values]
+            maxs = [max(column) for column in values]
+            if page_index == len(page_range.zone_maps):
+                page_range.zone_maps.append((mins, maxs))
+            else:
+                self._widen_zone_map(page_range.zone_maps[page_index], mins)
+                self._widen_zone_map(page_range.zone_maps[page_index], maxs)
+            chunk = array('q', self._reuse_rids(size))
+            start = self.reserve_rids(size - len(chunk))
+            chunk.extend(range(start, start + size - len(chunk)))
+            first = max(self.last_timestamp + 1, time_ns())
+            self.last_timestamp = first + size - 1
+            zeros = array('q', bytes(size * CELL_SIZE))
+            slot = page_set[INDIRECTION_COLUMN].write_many(zeros)
+            page_set[RID_COLUMN].write_many(chunk)
+            page_set[TIMESTAMP_COLUMN].write_many(array('q', range(first, first + size)))
+            page_set[SCHEMA_ENCODING_COLUMN].write_many(zeros)
+            for page, column in zip(page_set[METADATA_COLUMNS:], values):
+                page.write_many(column)
+            for offset, rid in enumerate(chunk):
+                self.page_directory[rid] = (range_index, BASE, page_index, slot + offset)
+            rids.extend(chunk)
+            position += size
+        return rids
+
+    def _append_tail(self, page_range, range_index, indirection, timestamp, schema_encoding, columns):
+        page_index = self._writable_page_set(page_range.tail_pages)
+        rid = self.new_tail_rid(page_range)
+        slot = self._write(page_range.tail_pages[page_index], [indirection, rid, timestamp, schema_encoding, *columns])
+        self.page_directory[rid] = (range_index, TAIL, page_index, slot)
+        return rid
+
+    """
+    # Returns the page set and slot holding the requested version of a base record
+    :param rid: int                 #RID of the base record
+    :param relative_version: int    #0 for the latest version, -1 for the one before it, and so on
+    :param columns_mask: int        #Bitmask of the columns that will be read from the returned page set
+    """
+    def locate_version(self, rid, relative_version=0, columns_mask=-1):
+        range_index, _, page_index, slot = self.page_directory[rid]
+        page_range = self.page_ranges[range_index]
+        base = page_range.base_pages[page_index]
+        indirection = base[INDIRECTION_COLUMN].read(slot)
+        # The latest value of a column that was never updated is still the one in the base record
+        if indirection == 0 or (relative_version == 0 and (indirection <= page_range.tps or not base[SCHEMA_ENCODING_COLUMN].read(slot) & columns_mask)):
+            if metrics.enabled:
+                metrics.count("page_directory.lookups")
+            return base, slot
+        if metrics.enabled:
+            # One more lookup and one hop into the tail pages, the version index makes deeper versions no farther
+            metrics.count("page_directory.lookups", 2)
+            metrics.count("read.tail_hops")
+        if relative_version < 0:
+            # Jump straight to the requested version, clamping at the original one
+            tail_rids = self.version_index[rid][1]
+            indirection = tail_rids[max(0, len(tail_rids) - 1 + relative_version)]
+        _, _, page_index, slot = self.page_directory[indirection]
+        return page_range.tail_pages[page_index], slot
+
+    """
+    # Returns the page set and slot holding the version of a base record that was current at timestamp,
+    # or None if the record did not exist yet
+    """
+    def locate_as_of(self, rid, timestamp):
+        range_index, _, page_index, slot = self.page_directory[rid]
+        page_range = self.page_ranges[range_index]
+        versions = self.version_index.get(rid)
+        if versions is None:
+            base = page_range.base_pages[page_index]
+            return (base, slot) if base[TIMESTAMP_COLUMN].read(slot) <= timestamp else None
+        timestamps, tail_rids = versions
+        position = bisect_right(timestamps, timestamp) - 1
+        if position < 0:
+            return None
+        _, _, page_index, slot = self.page_directory[tail_rids[position]]
+        return page_range.tail_pages[page_index], slot
+
+    """
+    # Returns the commit timestamp of the latest version of a base record, or None if it was deleted.
+    # Optimistic transactions compare it at commit to validate what they read.
+    """
+    def version_stamp(self, rid):
+        location = self.page_directory.get(rid)
+        if location is None or location[1] != BASE:
+            return None
+        versions = self.version_index.get(rid)
+        if versions is not None:
+            return versions[0][-1]
+        range_index, _, page_index, slot = location
+        return self.page_ranges[range_index].base_pages[page_index][TIMESTAMP_COLUMN].read(slot)
+
+    """
+    # Reads the given user columns of a base record at the requested version
+    """
+    def read(self, rid, columns, relative_version=0):
+        page_set, slot = self.locate_version(rid, relative_version, schema_mask(columns) if relative_version == 0 else -1)
+        return [page_set[METADATA_COLUMNS + column].read(slot) for column in columns]
+
+    """
+    # Reads the given user columns of a base record as of timestamp, or returns None if it did not exist yet
+    """
+    def read_as_of(self, rid, columns, timestamp):
+        location = self.locate_as_of(rid, timestamp)
+        if location is None:
+            return None
+        page_set, slot = location
+        return [page_set[METADATA_COLUMNS + column].read(slot) for column in columns]
+
+    """
+    # Appends a cumulative tail record for a base record and points its indirection at it
+    :param rid: int                 #RID of the base record
+    :param columns: list            #New values, None for columns that are not updated
+    :param schema_encoding: int     #Optional precomputed schema encoding bitmask of columns
+    """
+    def update_record(self, rid, columns, schema_encoding=None):
+        if self.record_cache is not None:
+            self.record_cache.invalidate(rid)
+        range_index, _, page_index, slot = self.page_directory[rid]
+        page_range = self.page_ranges[range_index]
+        base = page_range.base_pages[page_index]
+        indirection = base[INDIRECTION_COLUMN].read(slot)
+        if indirection == 0:
+            # First update: preserve the original values as the oldest version of the record
+            current = [base[METADATA_COLUMNS + column].read(slot) for column in range(self.num_columns)]
+            inserted = base[TIMESTAMP_COLUMN].read(slot)
+            indirection = self._append_tail(page_range, range_index, rid, inserted, 0, current)
+            versions = self.version_index[rid] = ([inserted], [indirection])
+        else:
+            current = self.read(rid, range(self.num_columns))
+            versions = self.version_index[rid]
+        if schema_encoding is None:
+            schema_encoding = 0
+            for column, value in enumerate(columns):
+                if value is not None:
+                    schema_encoding |= 1 << column
+        values = [old if new is None else new for old, new in zip(current, columns)]
+        timestamp = self.timestamp()
+        tail_rid = self._append_tail(page_range, range_index, indirection, timestamp, schema_encoding, values)
+        versions[0].append(timestamp)
+        versions[1].append(tail_rid)
+        base[INDIRECTION_COLUMN].update(slot, tail_rid)
+        base[SCHEMA_ENCODING_COLUMN].update(slot, base[SCHEMA_ENCODING_COLUMN].read(slot) | schema_encoding)
+        # Until the next merge the zone map has to cover both the old and the new values
+        self._widen_zone_map(page_range.zone_maps[page_index], columns)
+        page_range.dirty.add(page_index)
+        page_range.num_updates += 1
+        if page_range.num_updates >= MERGE_THRESHOLD:
+            self.__merge(range_index)
+        return tail_rid
+
+    """
+    # Returns what rollback_update needs to know about a base record before an update that may be rolled
+    # back: its schema encoding and the number of merges of its page range so far
+    """
+    def rollback_state(self, rid):
+        range_index, _, page_index, slot = self.page_directory[rid]
+        page_range = self.page_ranges[range_index]
+        return page_range.base_pages[page_index][SCHEMA_ENCODING_COLUMN].read(slot), page_range.merges
+
+    """
+    # Removes the latest version of a base record, written by a transaction that aborted, so that the
+    # previous version is the latest again and the aborted one never shows in the history of the record.
+    # Its tail record becomes garbage. If a merge wrote the aborted values to the base record meanwhile, the
+    # page range reads the previous version from its tail record again until the next merge.
+    :param rid: int                 #RID of the base record
+    :param tail_rid: int            #Tail RID update_record returned for the aborted update
+    :param state: tuple             #rollback_state of the record before the update
+    """
+    def rollback_update(self, rid, tail_rid, state):
+        schema_encoding, merges = state
+        if self.record_cache is not None:
+            self.record_cache.invalidate(rid)
+        range_index, _, page_index, slot = self.page_directory[rid]
+        page_range = self.page_ranges[range_index]
+        base = page_range.base_pages[page_index]
+        # The aborting transaction still holds the exclusive lock of the record, so nothing came after it
+        timestamps, tail_rids = self.version_index[rid]
+        timestamps.pop()
+        tail_rids.pop()
+        del self.page_directory[tail_rid]
+        page_range.garbage += 1
+        base[INDIRECTION_COLUMN].update(slot, tail_rids[-1])
+        if page_range.merges != merges:
+            # Tail records hold whole rows, so reading more of them than needed is only slower. The schema
+            # encoding keeps the bits of the aborted update, the base record holds its values.
+            page_range.tps = min(page_range.tps, tail_rids[-1] - 1)
+        else:
+            base[SCHEMA_ENCODING_COLUMN].update(slot, schema_encoding)
+        self._widen_zone_map(page_range.zone_maps[page_index], self.read(rid, range(self.num_columns)))
+        page_range.dirty.add(page_index)
+
+    """
+    # Tombstones a base record: its indirection is set to DELETED and it leaves the page directory. Its tail
+    # records stay until the next merge, which compacts the slot away, recycles the RID and drops the tail
+    # records, unless the record is still locked by the transaction that deleted it.
+    """
+    def delete_record(self, rid):
+        if self.record_cache is not None:
+            self.record_cache.invalidate(rid)
+        location = self.page_directory.pop(rid)
+        _, _, page_index, slot = location
+        page_range = self.page_ranges[location[0]]
+        indirection = page_range.base_pages[page_index][INDIRECTION_COLUMN]
+        self.deleted[rid] = (indirection.read(slot), location)
+        indirection.update(slot, DELETED)
+        page_range.dirty.add(page_index)
+        page_range.deletes += 1
+        page_range.num_updates += 1
+        if page_range.num_updates >= MERGE_THRESHOLD:
+            self.__merge(location[0])
+
+    """
+    # Brings back a record deleted by a transaction that aborted, with its history
+    """
+    def restore_record(self, rid):
+        if self.record_cache is not None:
+            self.record_cache.invalidate(rid)
+        indirection, location = self.deleted.pop(rid)
+        _, _, page_index, slot = location
+        page_range = self.page_ranges[location[0]]
+        page_range.base_pages[page_index][INDIRECTION_COLUMN].update(slot, indirection)
+        page_range.dirty.add(page_index)
+        page_range.deletes -= 1
+        self.page_directory[rid] = location
+
+    """
+    # Returns the RIDs of the live base records in a base page set
+    """
+    def _live_rids(self, page_set):
+        return [rid for rid, indirection in zip(page_set[RID_COLUMN].values(), page_set[INDIRECTION_COLUMN].values()) if indirection != DELETED]
+
+    """
+    # Returns the RIDs of the base records whose latest value in column lies between begin and end,
+    # skipping base page sets whose zone map does not intersect the range
+    """
+    def scan(self, column, begin, end):
+        rids = []
+        for page_range in self.page_ranges:
+            for page_set, (mins, maxs) in zip(page_range.base_pages, page_range.zone_maps):
+                if maxs[column] < begin or mins[column] > end:
+                    continue
+                for rid in self._live_rids(page_set):
+                    if begin <= self.read(rid, (column,))[0] <= end:
+                        rids.append(rid)
+        return rids
+
+    """
+    # Returns one pickled snapshot per page range of what is needed to resolve the latest values of column
+    # without the table: (tps, schema bit of column, base page sets, tail page sets), where base page sets
+    # hold the indirection, RID, schema encoding and column pages and tail page sets the RID and column pages.
+    # The caller holds the latch, pickling here keeps the snapshot consistent once it is released.
+    """
+    def snapshot_column(self, column):
+        physical = METADATA_COLUMNS + column
+        snapshots = []
+        for page_range in self.page_ranges:
+            base_pages = [[page_set[INDIRECTION_COLUMN], page_set[RID_COLUMN], page_set[SCHEMA_ENCODING_COLUMN], page_set[physical]]
+                          for page_set in page_range.base_pages]
+            tail_pages = [[page_set[RID_COLUMN], page_set[physical]] for page_set in page_range.tail_pages]
+            snapshots.append(pickle.dumps((page_range.tps, 1 << column, base_pages, tail_pages), pickle.HIGHEST_PROTOCOL))
+        return snapshots
+
+    """
+    # Splits the base records with keys between begin and end into the base page sets that lie entirely
+    # inside the range and have no unmerged updates, whose latest values can be aggregated directly on
+    # their (possibly compressed) pages, and the RIDs of the remaining records in the range
+    """
+    def partition_key_range(self, begin, end):
+        page_sets = []
+        rids = []
+        key = self.key
+        for page_range in self.page_ranges:
+            for page_index, (page_set, (mins, maxs)) in enumerate(zip(page_range.base_pages, page_range.zone_maps)):
+                if maxs[key] < begin or mins[key] > end:
+                    continue
+                if begin <= mins[key] and maxs[key] <= end and page_index not in page_range.dirty:
+                    page_sets.append(page_set)
+                    continue
+                for rid in self._live_rids(page_set):
+                    if begin <= self.read(rid, (key,))[0] <= end:
+                        rids.append(rid)
+        return page_sets, rids
+
+    """
+    # Consolidates the tail records of a page range into fresh base pages. Live records are packed into
+    # new page sets with their latest values, so deleted slots are compacted away and their RIDs recycled.
+    # Zone maps are recomputed from the merged values, and full page sets, which will not be appended to
+    # anymore, have their read-only columns compressed.
+    """
+    def __merge(self, range_index):
+        start = perf_counter()
+        page_range = self.page_ranges[range_index]
+        # Tail RIDs only increase within a page range, so all of its tail records so far are merged
+        tps = max(page_range.tps, page_range.next_tail_rid - 1)
+        merged_pages = []
+        freed = []
+        kept = 0
+        # Merged page sets holding tombstones, which stay dirty so aggregates do not read them whole
+        tombstones = set()
+        for page_set in page_range.base_pages:
+            indirections = page_set[INDIRECTION_COLUMN].values()
+            timestamps = page_set[TIMESTAMP_COLUMN].values()
+            schemas = page_set[SCHEMA_ENCODING_COLUMN].values()
+            for slot, rid in enumerate(page_set[RID_COLUMN].values()):
+                if indirections[slot] == DELETED:
+                    tombstone = self.deleted.get(rid)
+                    if tombstone is None or rid not in self.lock_manager.locks:
+                        self.deleted.pop(rid, None)
+                        versions = self.version_index.pop(rid, None)
+                        if versions is not None:
+                            for tail_rid in versions[1]:
+                                del self.page_directory[tail_rid]
+                            page_range.garbage += len(versions[1])
+                        freed.append(rid)
+                        continue
+                    # Deleted by a transaction still running, kept with its latest values in case it aborts
+                    indirection = tombstone[0]
+                    if indirection:
+                        _, _, tail_index, tail_slot = self.page_directory[indirection]
+                        values = [page.read(tail_slot) for page in page_range.tail_pages[tail_index][METADATA_COLUMNS:]]
+                    else:
+                        values = [page.read(slot) for page in page_set[METADATA_COLUMNS:]]
+                    page_index = self._writable_page_set(merged_pages)
+                    merged_slot = self._write(merged_pages[page_index], [DELETED, rid, timestamps[slot], schemas[slot], *values])
+                    self.deleted[rid] = (indirection, (range_index, BASE, page_index, merged_slot))
+                    tombstones.add(page_index)
+                    kept += 1
+                    continue
+                values = self.read(rid, range(self.num_columns))
+                page_index = self._writable_page_set(merged_pages)
+                merged_slot = self._write(merged_pages[page_index], [indirections[slot], rid, timestamps[slot], schemas[slot], *values])
+                self.page_directory[rid] = (range_index, BASE, page_index, merged_slot)
+        zone_maps = []
+        for merged in merged_pages:
+            zone_maps.append(([page.min() for page in merged[METADATA_COLUMNS:]], [page.max() for page in merged[METADATA_COLUMNS:]]))
+            if COMPRESS_MERGED_PAGES and not merged[RID_COLUMN].has_capacity():
+                for column in range(RID_COLUMN, self.total_columns):
+                    if column != SCHEMA_ENCODING_COLUMN:
+                        merged[column] = compress(merged[column])
+                        self.page_usage.pages += merged[column].size() - PAGE_SIZE
+        self.page_usage.pages -= self.__page_bytes(page_range.base_pages)
+        page_range.base_pages = merged_pages
+        page_range.zone_maps = zone_maps
+        page_range.dirty = tombstones
+        page_range.tps = tps
+        page_range.num_updates = 0
+        page_range.deletes = kept
+        page_range.merges += 1
+        self.__collect_versions(range_index)
+        self.free_rids.extend(freed)
+        if metrics.enabled:
+            metrics.observe("table.merge", perf_counter() - start)
+
+    """
+    # Reclaims the tail records of a page range that are older than both the configured select_version
+    # retention and the version visible to the oldest running transaction, then compacts the remaining
+    # tail records, dropping those of deleted records as well, into fresh tail pages
+    """
+    def __collect_versions(self, range_index):
+        page_range = self.page_ranges[range_index]
+        if self.version_retention is None and not page_range.garbage:
+            return
+        horizon = snapshots.oldest()
+        live = []
+        # Oldest surviving tail RID -> base RID, its indirection has to end the chain
+        chain_ends = {}
+        reclaimed = page_range.garbage
+        for page_set in page_range.base_pages:
+            for rid in page_set[RID_COLUMN].values():
+                versions = self.version_index.get(rid)
+                if versions is None:
+                    continue
+                timestamps, tail_rids = versions
+                cut = 0
+                if self.version_retention is not None:
+                    # Versions newer than the one visible at the horizon may belong to a transaction that
+                    # still aborts, so the versions kept are counted from that one
+                    visible = len(tail_rids) if horizon is None else bisect_right(timestamps, horizon)
+                    cut = visible - 1 - self.version_retention
+                if cut > 0:
+                    for tail_rid in tail_rids[:cut]:
+                        del self.page_directory[tail_rid]
+                    del timestamps[:cut]
+                    del tail_rids[:cut]
+                    reclaimed += cut
+                live.extend(tail_rids)
+                chain_ends[tail_rids[0]] = rid
+        if not reclaimed:
+            return
+        tail_pages = []
+        for tail_rid in sorted(live):
+            _, _, page_index, slot = self.page_directory[tail_rid]
+            row = [page.read(slot) for page in page_range.tail_pages[page_index]]
+            if tail_rid in chain_ends:
+                row[INDIRECTION_COLUMN] = chain_ends[tail_rid]
+            page_index = self._writable_page_set(tail_pages)
+            slot = self._write(tail_pages[page_index], row)
+            self.page_directory[tail_rid] = (range_index, TAIL, page_index, slot)
+        self.page_usage.pages -= self.__page_bytes(page_range.tail_pages)
+        page_range.tail_pages = tail_pages
+        page_range.garbage = 0
+
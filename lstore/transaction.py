@@ -1,5 +1,23 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.snapshots import snapshots
+from lstore.metrics import metrics
+from lstore.profiler import TransactionProfile
+from threading import local, current_thread
+from time import time_ns, perf_counter, thread_time
+
+# Transaction currently running on each thread, consulted by queries for locking and undo logging
+_context = local()
+
+# Why a transaction aborted: another transaction held a lock it needed or changed a record it read, so
+# running it again may commit, or one of its queries failed on its own, so running it again fails the same way
+CONFLICT = "conflict"
+FAILURE = "failure"
+
+
+def running_transaction():
+    return getattr(_context, 'transaction', None)
+
 
 class Transaction:
 
@@ -8,6 +26,29 @@ class Transaction:
     """
     def __init__(self):
         self.queries = []
+        # Lock manager -> resources this transaction holds locks on through it
+        self.locks = {}
+        # Compensating actions for the queries executed so far, applied in reverse on abort
+        self.undo_log = []
+        # Profiler the runs of this transaction are reported to, set by a profiling TransactionWorker
+        self.profiler = None
+        self.lock_wait = 0.0
+        # Tables holding rows this transaction inserted into an insert buffer, flushed on commit
+        self.buffered_tables = set()
+        # Optimistic transactions read without locks while reading is set, remembering the version of
+        # every record read, and defer their writes until these versions are validated at commit
+        self.optimistic = False
+        self.reading = False
+        self.read_set = {}
+        self.write_set = []
+        # (table, primary key) -> row, None if deleted, of every record the deferred writes change, which
+        # the reads of an optimistic transaction see in place of the stored record
+        self.writes = {}
+        # Seconds the write phase of the last run of an optimistic transaction took
+        self.write_phase_time = 0.0
+        # Set when a lock request or a validation fails during a run, CONFLICT or FAILURE after an abort
+        self.conflicted = False
+        self.abort_reason = None
         pass
 
     """
@@ -21,23 +62,167 @@ class Transaction:
         self.queries.append((query, args))
         # use grades_table for aborting
 
+    """
+    # Acquires a lock for this transaction, remembering it so it is released on commit or abort
+    # Returns False if the lock is held by a conflicting transaction
+    """
+    def acquire(self, lock_manager, resource, exclusive):
+        if self.profiler is not None:
+            start = perf_counter()
+            granted = lock_manager.acquire(self, resource, exclusive)
+            self.lock_wait += perf_counter() - start
+        else:
+            granted = lock_manager.acquire(self, resource, exclusive)
+        if not granted:
+            self.conflicted = True
+            return False
+        self.locks.setdefault(lock_manager, set()).add(resource)
+        return True
+
+    """
+    # Remembers the version of a record read by an optimistic transaction, the first read of it counts
+    """
+    def record_read(self, table, rid):
+        key = (table, rid)
+        if key not in self.read_set:
+            self.read_set[key] = table.version_stamp(rid)
+
+    """
+    # Defers a write of an optimistic transaction to its write phase
+    """
+    def defer(self, query, args):
+        self.write_set.append((query, args))
+
+    """
+    # Validates the reads of an optimistic transaction and applies its writes. Each record read is share
+    # locked and checked to still be at the version read, so none of them can change until the transaction
+    # ends; the writes then run as under two-phase locking.
+    # Returns False if validation or a write fails
+    """
+    def __write_phase(self):
+        self.reading = False
+        for (table, rid), stamp in self.read_set.items():
+            if not self.acquire(table.lock_manager, rid, False):
+                return False
+            with table.latch:
+                current = table.version_stamp(rid)
+            if current != stamp:
+                self.conflicted = True
+                if metrics.enabled:
+                    metrics.count("transaction.validation_failures")
+                return False
+        for query, args in self.write_set:
+            if self.__call(query, args) is False:
+                return False
+        return True
+
+    """
+    # Runs a query, a query that raises fails like one returning False, and not from a conflict
+    """
+    def __call(self, query, args):
+        try:
+            return query(*args)
+        except Exception:
+            self.conflicted = False
+            return False
+
+    """
+    # Records action(*args) as the way to undo the query that was just executed
+    """
+    def log_undo(self, action, *args):
+        self.undo_log.append((action, args))
+
         
     # If you choose to implement this differently this method must still return True if transaction commits or False on abort
     def run(self):
-        for query, args in self.queries:
-            result = query(*args)
-            # If the query has failed the transaction should abort
-            if result == False:
-                return self.abort()
-        return self.commit()
+        if self.profiler is None:
+            return self.__attempt(None)
+        wall_start = perf_counter()
+        cpu_start = thread_time()
+        self.lock_wait = 0.0
+        timings = []
+        committed = False
+        try:
+            committed = self.__attempt(timings)
+            return committed
+        finally:
+            self.profiler.record(TransactionProfile(current_thread().name, perf_counter() - wall_start, thread_time() - cpu_start, self.lock_wait, timings, committed))
+
+    """
+    # Runs the queries once and commits, or aborts as soon as one fails. Unless timings is None, the time of
+    # every query, and of the write phase of an optimistic transaction, is appended to it as (name, seconds).
+    """
+    def __attempt(self, timings):
+        # Versions this transaction may read are protected from garbage collection until it finishes
+        token = snapshots.register(time_ns())
+        self.__begin()
+        try:
+            for query, args in self.queries:
+                if timings is None:
+                    result = self.__call(query, args)
+                else:
+                    start = perf_counter()
+                    result = self.__call(query, args)
+                    timings.append((query.__name__, perf_counter() - start))
+                # If the query has failed the transaction should abort
+                if result is False:
+                    return self.abort()
+            if self.optimistic:
+                start = perf_counter()
+                valid = self.__write_phase()
+                self.write_phase_time = perf_counter() - start
+                if timings is not None:
+                    timings.append(("validate", self.write_phase_time))
+                if not valid:
+                    return self.abort()
+            return self.commit()
+        finally:
+            _context.transaction = None
+            snapshots.release(token)
+
+    def __begin(self):
+        self.reading = self.optimistic
+        self.read_set = {}
+        self.write_set = []
+        self.writes = {}
+        self.conflicted = False
+        self.abort_reason = None
+        _context.transaction = self
 
     
+    """
+    # Undoes the queries executed so far and records in abort_reason whether the abort came from a conflict
+    # Returns False
+    """
     def abort(self):
-        #TODO: do roll-back and any other necessary operations
+        self.abort_reason = CONFLICT if self.conflicted else FAILURE
+        # Compensating actions run outside the transaction so they neither lock nor log,
+        # the exclusive locks still held keep other transactions away until they are done
+        _context.transaction = None
+        for action, args in reversed(self.undo_log):
+            action(*args)
+        self.__release()
+        if metrics.enabled:
+            metrics.count("transaction.aborts" if self.abort_reason == CONFLICT else "transaction.failures")
         return False
 
     
     def commit(self):
-        # TODO: commit to database
+        for table in self.buffered_tables:
+            table.flush_inserts(self)
+        self.__release()
+        if metrics.enabled:
+            metrics.count("transaction.commits")
         return True
 
+    def __release(self):
+        for lock_manager, resources in self.locks.items():
+            lock_manager.release(self, resources)
+        self.locks = {}
+        self.undo_log = []
+        self.buffered_tables = set()
+        self.reading = False
+        self.read_set = {}
+        self.write_set = []
+        self.writes = {}
+
@@ -1,15 +1,33 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.transaction import CONFLICT
+from threading import Thread
+from random import random
+from time import sleep
+
+# Seconds waited before the first retry of a transaction aborted by a conflict, doubled on every further
+# retry up to MAX_RETRY_BACKOFF, each wait drawn at random below it so conflicting workers spread out
+RETRY_BACKOFF = 0.0001
+MAX_RETRY_BACKOFF = 0.01
 
 class TransactionWorker:
 
     """
     # Creates a transaction worker object.
     """
-    def __init__(self, transactions = []):
+    def __init__(self, transactions = None, profiler = None, optimistic = False):
         self.stats = []
-        self.transactions = transactions
+        self.transactions = [] if transactions is None else transactions
         self.result = 0
+        # Number of times a transaction was aborted by a conflict and retried
+        self.aborts = 0
+        # Number of transactions aborted because one of their queries failed, which are not retried
+        self.failures = 0
+        self.thread = None
+        # Optional lstore.profiler.Profiler every transaction run by this worker reports to
+        self.profiler = profiler
+        # Run transactions with optimistic concurrency control instead of two-phase locking
+        self.optimistic = optimistic
         pass
 
     
@@ -24,21 +42,36 @@ class TransactionWorker:
     Runs all transaction as a thread
     """
     def run(self):
-        pass
         # here you need to create a thread and call __run
+        self.thread = Thread(target=self.__run)
+        self.thread.start()
     
 
     """
     Waits for the worker to finish
     """
     def join(self):
-        pass
+        if self.thread is not None:
+            self.thread.join()
 
 
     def __run(self):
         for transaction in self.transactions:
+            if self.profiler is not None:
+                transaction.profiler = self.profiler
+            transaction.optimistic = self.optimistic
             # each transaction returns True if committed or False if aborted
-            self.stats.append(transaction.run())
+            committed = transaction.run()
+            # Retry while the transaction conflicts with others, backing off so the conflicting ones can finish
+            backoff = RETRY_BACKOFF
+            while not committed and transaction.abort_reason == CONFLICT:
+                self.aborts += 1
+                sleep(random() * backoff)
+                backoff = min(2 * backoff, MAX_RETRY_BACKOFF)
+                committed = transaction.run()
+            if not committed:
+                self.failures += 1
+            self.stats.append(committed)
         # stores the number of transactions that committed
         self.result = len(list(filter(lambda x: x, self.stats)))
 
@@ -0,0 +1,56 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+
+# The same transaction must read the same values, its own writes included, and leave the same records
+# behind whether its worker uses two-phase locking or optimistic concurrency control
+def run(optimistic):
+    db = Database()
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    grades_table.index.create_index(2)
+    for key in range(92106429, 92106439):
+        query.insert(key, 0, key % 3, 0, 0)
+
+    seen = []
+    def read(operation, *args):
+        def run_read():
+            result = operation(*args)
+            if isinstance(result, list):
+                result = sorted(record.columns for record in result)
+            seen.append(result)
+            return result is not False
+        run_read.__name__ = operation.__name__
+        return run_read
+
+    transaction = Transaction()
+    transaction.add_query(query.increment, grades_table, 92106429, 1)
+    transaction.add_query(query.increment, grades_table, 92106429, 1)
+    transaction.add_query(read(query.select, 92106429, 0, [1, 1, 1, 1, 1]), grades_table)
+    transaction.add_query(query.update, grades_table, 92106430, None, None, 0, 7, None)
+    transaction.add_query(read(query.select, 0, 2, [1, 1, 1, 1, 1]), grades_table)
+    transaction.add_query(query.delete, grades_table, 92106431)
+    transaction.add_query(query.insert, grades_table, 92106440, 5, 0, 0, 0)
+    transaction.add_query(read(query.sum, 92106429, 92106440, 1), grades_table)
+    transaction.add_query(read(query.aggregate, 92106429, 92106440, 3, ("count", "sum"), 2), grades_table)
+    transaction.add_query(query.add, grades_table, 92106440, 0, 100)
+    transaction.add_query(read(query.select, 92106540, 0, [1, 1, 1, 1, 1]), grades_table)
+    transaction.add_query(read(query.select, 92106440, 0, [1, 1, 1, 1, 1]), grades_table)
+    transaction.add_query(read(query.prepare_select(0, [1, 1, 1, 1, 1]), 92106431), grades_table)
+    worker = TransactionWorker([transaction], optimistic=optimistic)
+    worker.run()
+    worker.join()
+
+    final = sorted(record.columns for key in range(92106429, 92106541) for record in query.select(key, 0, [1, 1, 1, 1, 1]))
+    return worker.result, seen, final
+
+errors = 0
+locking = run(False)
+optimistic = run(True)
+names = ('commits', 'reads inside the transaction', 'records after it')
+for name, expected, result in zip(names, locking, optimistic):
+    if result != expected:
+        print('optimistic', name, ':', result, ', correct:', expected)
+        errors += 1
+print('Errors', errors)
@@ -0,0 +1,58 @@
+from lstore.db import Database
+from lstore.query import Query
+
+from random import choice, randint, seed
+
+# Prepared updates must give the same records, versions and index entries as Query.update, including
+# when some of the masked columns are given None
+db = Database()
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+grades_table.index.create_index(2)
+
+records = {}
+number_of_records = 1000
+seed(3562901)
+
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    query.insert(*records[key])
+
+update = query.prepare_update([0, 1, 1, 0, 1])
+errors = 0
+for _ in range(3):
+    for key in records:
+        values = [choice([None, randint(0, 20)]) for _ in range(3)]
+        if update(key, *values) is not True:
+            print('prepared update failed on', key, values)
+            errors += 1
+        for column, value in zip((1, 2, 4), values):
+            if value is not None:
+                records[key][column] = value
+
+for key in records:
+    result = query.select(key, 0, [1, 1, 1, 1, 1])[0].columns
+    if result != records[key]:
+        print('prepared update error on', key, ':', result, ', correct:', records[key])
+        errors += 1
+
+# The index on column 2 must hold every record under its current value, and nothing under None
+for value in range(0, 21):
+    result = sorted(record.key for record in query.select(value, 2, [1, 0, 0, 0, 0]))
+    correct = sorted(key for key in records if records[key][2] == value)
+    if result != correct:
+        print('index error on value', value, ':', len(result), 'records, correct:', len(correct))
+        errors += 1
+if query.select(None, 2, [1, 0, 0, 0, 0]):
+    print('index error: records indexed under None')
+    errors += 1
+
+# A prepared update with only None values changes nothing
+key = 92106429
+update(key, None, None, None)
+result = query.select(key, 0, [1, 1, 1, 1, 1])[0].columns
+if result != records[key]:
+    print('all-None prepared update error on', key, ':', result, ', correct:', records[key])
+    errors += 1
+print('Errors', errors)
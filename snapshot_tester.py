@@ -0,0 +1,108 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+
+from random import randint, random, seed
+import os
+import shutil
+
+db = Database()
+db.open('./CS451')
+# Every transaction sets all the grades of one group of students to a value of its own, and half of them
+# fail at the end and abort, while snapshots are taken. A snapshot must hold whole committed transactions
+# only: the grades of a group all equal, and never a value of an aborted transaction.
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+number_of_groups = 50
+group_size = 10
+number_of_transactions = 200
+num_threads = 8
+number_of_snapshots = 5
+seed(49)
+
+keys = [92106429 + i for i in range(number_of_groups * group_size)]
+for key in keys:
+    query.insert(key, 0, 0, 0, 0)
+missing_key = 92106429 + len(keys)
+groups = [keys[group * group_size:(group + 1) * group_size] for group in range(number_of_groups)]
+print("Insert finished")
+
+# Values written by transactions that abort
+aborted = set()
+workers = [TransactionWorker(optimistic=(thread % 2 == 1)) for thread in range(num_threads)]
+value = 0
+for worker in workers:
+    for _ in range(number_of_transactions):
+        value += 1
+        transaction = Transaction()
+        for key in groups[randint(0, number_of_groups - 1)]:
+            transaction.add_query(query.update, grades_table, key, None, value, None, value, None)
+        if random() < 0.5:
+            transaction.add_query(query.update, grades_table, missing_key, None, value, None, value, None)
+            aborted.add(value)
+        worker.add_transaction(transaction)
+
+errors = 0
+
+
+def check(path, expected=None):
+    global errors
+    snapshot = Database()
+    snapshot.open(path)
+    snapshot_query = Query(snapshot.get_table('Grades'))
+    for group in groups:
+        values = []
+        for key in group:
+            result = snapshot_query.select(key, 0, [1, 1, 1, 1, 1])
+            if len(result) != 1:
+                errors += 1
+                print('snapshot error in', path, ': no record', key)
+                continue
+            columns = result[0].columns
+            values.append(columns[1])
+            if columns[1] != columns[3] or columns[2] != 0 or columns[4] != 0:
+                errors += 1
+                print('snapshot error in', path, ': partial update on', key, ':', columns)
+            if expected is not None and columns != expected[key]:
+                errors += 1
+                print('snapshot error in', path, 'on', key, ':', columns, ', correct:', expected[key])
+        if len(set(values)) > 1:
+            errors += 1
+            print('snapshot error in', path, ': group', group[0], 'is partially updated:', values)
+        if aborted.intersection(values):
+            errors += 1
+            print('snapshot error in', path, ': group', group[0], 'holds aborted values', aborted.intersection(values))
+    for group in groups:
+        previous = snapshot_query.select_version(group[0], 0, [1, 1, 1, 1, 1], -1)[0].columns[1]
+        if previous in aborted:
+            errors += 1
+            print('snapshot error in', path, ': history of', group[0], 'holds aborted value', previous)
+    snapshot.close()
+
+
+for worker in workers:
+    worker.run()
+paths = []
+while len(paths) < number_of_snapshots or any(worker.thread.is_alive() for worker in workers):
+    path = os.path.join('CS451', 'snapshot%d' % len(paths))
+    shutil.rmtree(path, ignore_errors=True)
+    db.snapshot(path)
+    paths.append(path)
+for worker in workers:
+    worker.join()
+for path in paths:
+    check(path)
+print("Snapshot finished with", len(paths), "snapshots")
+
+# Once the writers are done a snapshot is the database itself
+path = os.path.join('CS451', 'snapshot_final')
+shutil.rmtree(path, ignore_errors=True)
+db.snapshot(path)
+final = {key: query.select(key, 0, [1, 1, 1, 1, 1])[0].columns for key in keys}
+check(path, final)
+print("Reopen finished")
+db.close()
+
+print("Errors", errors)
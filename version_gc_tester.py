@@ -0,0 +1,111 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+from random import randint, seed
+from threading import Thread, Event
+
+db = Database()
+db.open('./CS451')
+# Merges collect the versions past the select_version retention of the table, but never one a running
+# transaction may still read: the version visible when it started and the retained ones before it stay
+grades_table = db.create_table('Grades', 5, 0)
+grades_table.version_retention = 2
+query = Query(grades_table)
+
+# the versions of every record, oldest first, to check select_version
+versions = {}
+errors = 0
+
+number_of_records = 1000
+number_of_updates = 6
+retention = grades_table.version_retention
+
+seed(31)
+
+
+def update_all():
+    for key in keys:
+        updated_columns = [None, randint(0, 20), None, randint(0, 20), None]
+        record = versions[key][-1].copy()
+        for column, value in enumerate(updated_columns):
+            if value is not None:
+                record[column] = value
+        versions[key].append(record)
+        query.update(key, *updated_columns)
+
+
+# Checks every version of every record back from the current one. The kept newest versions are exact, older
+# ones were collected and select_version returns the oldest version left instead.
+def check(kept):
+    global errors
+    for key in keys:
+        for relative_version in range(0, -len(versions[key]), -1):
+            expected = versions[key][max(relative_version - 1, -kept)]
+            result = query.select_version(key, 0, [1, 1, 1, 1, 1], relative_version)[0]
+            if result.columns != expected:
+                errors += 1
+                print('select_version error on', key, 'version', relative_version, ':', result.columns, ', correct:', expected)
+    tail_records = len(grades_table.page_directory) - len(keys) - 1
+    if tail_records > len(keys) * kept:
+        errors += 1
+        print('merge error:', tail_records, 'tail records left, at most', len(keys) * kept, 'expected')
+
+
+# A record of its own for the long transaction to read, the others are updated while it runs
+query.insert(92106429, 0, 0, 0, 0)
+keys = []
+for i in range(1, number_of_records + 1):
+    key = 92106429 + i
+    versions[key] = [[key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]]
+    query.insert(*versions[key][0])
+    keys.append(key)
+print("Insert finished")
+
+for _ in range(number_of_updates):
+    update_all()
+grades_table.merge()
+check(retention + 1)
+print("Merge finished")
+
+started = Event()
+finish = Event()
+
+
+def hold():
+    started.set()
+    finish.wait()
+    return True
+
+
+transaction = Transaction()
+transaction.add_query(query.select, grades_table, 92106429, 0, [1, 1, 1, 1, 1])
+transaction.add_query(hold, grades_table)
+thread = Thread(target=transaction.run)
+thread.start()
+started.wait()
+for _ in range(number_of_updates):
+    update_all()
+grades_table.merge()
+# The version visible when the transaction started and the retained ones before it are kept
+check(number_of_updates + retention + 1)
+print("Running transaction finished")
+
+finish.set()
+thread.join()
+update_all()
+grades_table.merge()
+check(retention + 1)
+print("Collect finished")
+
+db.close()
+
+db = Database()
+db.open('./CS451')
+grades_table = db.get_table('Grades')
+query = Query(grades_table)
+check(retention + 1)
+print("Reopen finished")
+db.close()
+
+print("Errors", errors)
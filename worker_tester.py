@@ -0,0 +1,79 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction, CONFLICT, FAILURE
+from lstore.transaction_worker import TransactionWorker
+
+from random import randint, seed
+
+# Transactions whose queries fail on their own, or raise, must abort once, while transactions that only conflict
+# with each other must be retried until they commit
+db = Database()
+grades_table = db.create_table('Grades', 5, 0)
+query = Query(grades_table)
+
+number_of_records = 100
+num_threads = 8
+seed(3562901)
+
+records = {}
+for i in range(0, number_of_records):
+    key = 92106429 + i
+    records[key] = [key, 0, 0, 0, 0]
+    query.insert(*records[key])
+missing_key = 92106429 + number_of_records
+
+errors = 0
+for optimistic in (False, True):
+    failing = []
+    for make in (
+        lambda t: t.add_query(query.update, grades_table, missing_key, None, 1, None, None, None),
+        lambda t: t.add_query(query.delete, grades_table, missing_key),
+        lambda t: t.add_query(query.increment, grades_table, missing_key, 1),
+        lambda t: t.add_query(query.insert, grades_table, 92106429, 1, 1, 1, 1),
+        # A query that raises fails the transaction, which undoes the update and releases its lock
+        lambda t: (t.add_query(query.update, grades_table, 92106429, None, 1000, None, None, None),
+                   t.add_query(query.increment, grades_table, 92106429, 7)),
+    ):
+        transaction = Transaction()
+        make(transaction)
+        failing.append(transaction)
+
+    # Every worker increments the same keys, so their transactions conflict all the time
+    workers = [TransactionWorker(optimistic=optimistic) for _ in range(num_threads)]
+    increments = 0
+    for worker in workers:
+        for _ in range(20):
+            transaction = Transaction()
+            for _ in range(5):
+                transaction.add_query(query.increment, grades_table, 92106429 + randint(0, 9), 1)
+                increments += 1
+            worker.add_transaction(transaction)
+    for position, transaction in enumerate(failing):
+        workers[position % num_threads].add_transaction(transaction)
+
+    for worker in workers:
+        worker.run()
+    for worker in workers:
+        worker.thread.join(30)
+        if worker.thread.is_alive():
+            print('worker did not finish, optimistic', optimistic)
+            errors += 1
+    if errors:
+        break
+
+    committed = sum(worker.result for worker in workers)
+    failed = sum(worker.failures for worker in workers)
+    if committed != num_threads * 20 or failed != len(failing):
+        print('optimistic', optimistic, ':', committed, 'commits and', failed, 'failures, correct:', num_threads * 20, 'and', len(failing))
+        errors += 1
+    for transaction in failing:
+        if transaction.abort_reason != FAILURE:
+            print('optimistic', optimistic, ': abort reason', transaction.abort_reason, ', correct:', FAILURE)
+            errors += 1
+    total = query.sum(92106429, 92106429 + 9, 1)
+    if total != increments:
+        print('optimistic', optimistic, ': sum of increments', total, ', correct:', increments)
+        errors += 1
+    for key in range(92106429, 92106429 + 10):
+        query.update(key, None, 0, None, None, None)
+print('Errors', errors)